@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import League, Team, LiveMatch, MatchEvent, MatchLineup
+from .models import League, Team, LiveMatch, MatchEvent, MatchLineup, ApiUsage
 
 
 class LeagueAdmin(admin.ModelAdmin):
@@ -26,7 +26,8 @@ class MatchEventAdmin(admin.ModelAdmin):
 
 
 class LiveMatchAdmin(admin.ModelAdmin):
-    list_display = ('home_team', 'away_team', 'home_score', 'away_score', 'status')
+    list_display = ('home_team', 'away_team', 'home_score', 'away_score', 'status', 'state', 'kickoff_at')
+    list_filter = ('state',)
     search_fields = ('home_team__name', 'away_team__name', 'status')
 
 
@@ -39,8 +40,15 @@ class MatchLineupAdmin(admin.ModelAdmin):
     search_fields = ('player_name', 'match__home_team__name', 'match__away_team__name')
 
 
+class ApiUsageAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'period', 'period_start', 'count')
+    list_filter = ('period', 'endpoint')
+    ordering = ('-period_start', 'endpoint')
+
+
 admin.site.register(League, LeagueAdmin)
 admin.site.register(Team, TeamAdmin)
 admin.site.register(LiveMatch, LiveMatchAdmin)
 admin.site.register(MatchEvent, MatchEventAdmin)
 admin.site.register(MatchLineup, MatchLineupAdmin)
+admin.site.register(ApiUsage, ApiUsageAdmin)
@@ -0,0 +1,75 @@
+"""
+Liczniki zdarzeń meczu trzymane w LiveMatch (gole, kartki, minuta
+ostatniego zdarzenia) – listy meczów pokazują je bez zapytań o zdarzenia.
+
+- Ingest szczegółów (services.store_match_details) przelicza liczniki
+  zmienionego meczu w tej samej transakcji co zapis zdarzeń: jedno
+  zapytanie z agregacją po zdarzeniach meczu (indeks na match_id) i jedno
+  UPDATE.
+- Komenda verify_aggregates przelicza je hurtowo (GROUP BY match_id
+  paczkami meczów) i naprawia rozbieżności.
+"""
+from django.db.models import Count, Max, Q
+
+from .models import LiveMatch, MatchEvent
+
+AGGREGATE_FIELDS = ('goal_count', 'yellow_card_count', 'home_red_cards', 'away_red_cards', 'last_event_minute')
+
+# Wartości dla meczu bez zdarzeń
+EMPTY_AGGREGATES = {
+    'goal_count': 0, 'yellow_card_count': 0, 'home_red_cards': 0, 'away_red_cards': 0, 'last_event_minute': None,
+}
+
+_GOAL = Q(kind=MatchEvent.KIND_GOAL) & ~Q(incident_class__in=('missedPenalty', 'penaltyNotAwarded'))
+_CARD = Q(kind=MatchEvent.KIND_CARD, rescinded=False)
+_RED = _CARD & Q(incident_class__in=('red', 'yellowRed'))
+# Zdarzenia "z minutą" – bez markerów HT/FT i ogłoszeń doliczonego czasu
+_TIMED = Q(kind__in=(MatchEvent.KIND_GOAL, MatchEvent.KIND_CARD,
+                     MatchEvent.KIND_SUBSTITUTION, MatchEvent.KIND_VAR_DECISION))
+
+AGGREGATE_EXPRESSIONS = {
+    'goal_count': Count('id', filter=_GOAL),
+    'yellow_card_count': Count('id', filter=_CARD & Q(incident_class='yellow')),
+    'home_red_cards': Count('id', filter=_RED & Q(is_home_team=True)),
+    'away_red_cards': Count('id', filter=_RED & Q(is_home_team=False)),
+    'last_event_minute': Max('time', filter=_TIMED),
+}
+
+
+def compute_aggregates(match_ids):
+    """{match_id: {pole: wartość}} – jedno zapytanie GROUP BY match_id."""
+    result = {match_id: dict(EMPTY_AGGREGATES) for match_id in match_ids}
+    rows = (
+        MatchEvent.objects.filter(match_id__in=list(result)).order_by()
+        .values('match_id').annotate(**AGGREGATE_EXPRESSIONS)
+    )
+    for row in rows:
+        result[row.pop('match_id')] = row
+    return result
+
+
+def refresh_match_aggregates(match):
+    """Przelicza liczniki jednego meczu i zapisuje je (także na instancji). Zwraca słownik wartości."""
+    values = compute_aggregates([match.pk])[match.pk]
+    LiveMatch.objects.filter(pk=match.pk).update(**values)
+    for field, value in values.items():
+        setattr(match, field, value)
+    return values
+
+
+def verify_aggregates(match_ids, repair=True):
+    """
+    Porównuje zapisane liczniki meczów z przeliczonymi; repair=True
+    poprawia rozbieżne jednym bulk_update. Zwraca listę ID meczów z rozbieżnościami.
+    """
+    expected = compute_aggregates(match_ids)
+    drifted = []
+    for match in LiveMatch.objects.filter(id__in=list(expected)).only('id', *AGGREGATE_FIELDS):
+        values = expected[match.id]
+        if any(getattr(match, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(match, field, value)
+            drifted.append(match)
+    if repair and drifted:
+        LiveMatch.objects.bulk_update(drifted, AGGREGATE_FIELDS)
+    return [match.id for match in drifted]
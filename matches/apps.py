@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class MatchesConfig(AppConfig):
     name = 'matches'
+
+    def ready(self):
+        from .sqlite_tuning import on_connection_created
+        connection_created.connect(on_connection_created, dispatch_uid='matches.sqlite_tuning')
+
+        from . import search
+        from .models import League, Team
+        post_save.connect(search.on_team_saved, sender=Team, dispatch_uid='matches.search.team_saved')
+        post_save.connect(search.on_league_saved, sender=League, dispatch_uid='matches.search.league_saved')
+        post_delete.connect(search.on_team_deleted, sender=Team, dispatch_uid='matches.search.team_deleted')
+        post_delete.connect(search.on_league_deleted, sender=League, dispatch_uid='matches.search.league_deleted')
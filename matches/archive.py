@@ -0,0 +1,103 @@
+"""
+Archiwum surowych odpowiedzi API (incidents / lineups / live feed).
+
+Każda odpowiedź trafia do pliku .json.gz nazwanego skrótem SHA-256 treści
+(content-addressed), w katalogach dzielonych po api_id meczu:
+
+    <RAW_ARCHIVE_DIR>/incidents/<shard>/<api_id>/<sha256>.json.gz
+    <RAW_ARCHIVE_DIR>/live/<YYYY-MM-DD>/<sha256>.json.gz
+
+Identyczna treść nie jest zapisywana drugi raz – plik dostaje tylko nowy
+mtime, dzięki czemu "najnowsza odpowiedź" to plik z największym mtime.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+
+MATCH_KINDS = ('incidents', 'lineups')
+
+
+def archive_enabled():
+    return getattr(settings, 'RAW_ARCHIVE_ENABLED', True)
+
+
+def archive_root():
+    return Path(getattr(settings, 'RAW_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'raw_archive'))
+
+
+def _encode(data):
+    # Stabilna serializacja – ten sam JSON zawsze daje ten sam skrót
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _match_dir(kind, match_api_id):
+    match_api_id = int(match_api_id)
+    return archive_root() / kind / f"{match_api_id % 1000:03d}" / str(match_api_id)
+
+
+def store(kind, data, match_api_id=None):
+    """
+    Zapisuje odpowiedź w archiwum. Zwraca ścieżkę pliku.
+    kind: 'incidents' / 'lineups' (wymagają match_api_id) albo 'live'.
+    """
+    raw = _encode(data)
+    digest = hashlib.sha256(raw).hexdigest()
+
+    if match_api_id is not None:
+        directory = _match_dir(kind, match_api_id)
+    else:
+        directory = archive_root() / kind / date.today().isoformat()
+    path = directory / f"{digest}.json.gz"
+
+    if path.exists():
+        os.utime(path)
+        return path
+
+    directory.mkdir(parents=True, exist_ok=True)
+    # Zapis atomowy: plik tymczasowy + rename
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh, gzip.GzipFile(fileobj=fh, mode='wb', mtime=0) as gz:
+            gz.write(raw)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+def safe_store(kind, data, match_api_id=None):
+    """store() dla ścieżki pobierania – błąd archiwum nie może przerwać synchronizacji."""
+    if not archive_enabled():
+        return None
+    try:
+        return store(kind, data, match_api_id)
+    except Exception as e:
+        print(f"Błąd zapisu archiwum ({kind}, {match_api_id}): {e}")
+        return None
+
+
+def load(path):
+    with gzip.open(path, 'rb') as gz:
+        return json.loads(gz.read().decode('utf-8'))
+
+
+def history(kind, match_api_id):
+    """Ścieżki wszystkich zarchiwizowanych odpowiedzi meczu, od najstarszej."""
+    directory = _match_dir(kind, match_api_id)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob('*.json.gz'), key=lambda p: p.stat().st_mtime)
+
+
+def latest(kind, match_api_id):
+    """Najnowsza zarchiwizowana odpowiedź meczu albo None."""
+    paths = history(kind, match_api_id)
+    return load(paths[-1]) if paths else None
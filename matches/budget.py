@@ -0,0 +1,164 @@
+"""
+Budżet zapytań do API (limit planu RapidAPI).
+
+- UsageTracker liczy zapytania per endpoint w pamięci (bezpiecznie wątkowo –
+  wątki pobierające nie dotykają bazy), a flush() zapisuje je do ApiUsage
+  per dzień i miesiąc.
+- remaining() porównuje zużycie z limitami z settings.SPORT_API_PLAN.
+- admit() układa oczekujące pobrania w kolejce priorytetowej i przy
+  kończącym się budżecie odrzuca te o niskim priorytecie.
+"""
+import heapq
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ApiUsage
+
+# Priorytety – mniejsza liczba = ważniejsze
+PRIORITY_LIVE_TOP = 0   # mecz na żywo w topowej lidze
+PRIORITY_LIVE = 1       # pozostałe mecze na żywo
+PRIORITY_SCHEDULED = 2  # przed meczem / przerwa
+PRIORITY_BACKFILL = 3   # reimport historii
+
+# Priorytet p jest obsługiwany tylko, gdy pozostała część budżetu > próg[p]
+DEFAULT_SHED_THRESHOLDS = {
+    PRIORITY_LIVE_TOP: 0.0,
+    PRIORITY_LIVE: 0.05,
+    PRIORITY_SCHEDULED: 0.2,
+    PRIORITY_BACKFILL: 0.5,
+}
+
+
+class UsageTracker:
+    """Bufor liczników zapytań; zapis do bazy dopiero w flush()."""
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, count=1):
+        with self._lock:
+            self._pending[endpoint] += count
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Zapisuje zbuforowane liczniki (dzień + miesiąc). Zwraca liczbę zapisanych zapytań."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+
+        today = timezone.localdate()
+        periods = (
+            (ApiUsage.PERIOD_DAY, today),
+            (ApiUsage.PERIOD_MONTH, today.replace(day=1)),
+        )
+        try:
+            with transaction.atomic():
+                for endpoint, count in pending.items():
+                    for period, start in periods:
+                        _increment(endpoint, period, start, count)
+        except Exception:
+            # Nie gubimy liczników – wrócą przy następnym flush()
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return sum(pending.values())
+
+
+def _increment(endpoint, period, start, count):
+    lookup = {'endpoint': endpoint, 'period': period, 'period_start': start}
+    if ApiUsage.objects.filter(**lookup).update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            ApiUsage.objects.create(count=count, **lookup)
+    except IntegrityError:
+        # Ktoś utworzył wiersz w międzyczasie
+        ApiUsage.objects.filter(**lookup).update(count=F('count') + count)
+
+
+tracker = UsageTracker()
+
+
+def record(endpoint, count=1):
+    tracker.record(endpoint, count)
+
+
+def flush():
+    return tracker.flush()
+
+
+def _plan():
+    return getattr(settings, 'SPORT_API_PLAN', {})
+
+
+def remaining():
+    """
+    Stan budżetu: {'daily': {...}, 'monthly': {...}, 'fraction': float|None}.
+    Każdy okres: used / limit / remaining (limit None = bez limitu).
+    fraction – najmniejsza pozostała część spośród skonfigurowanych limitów.
+    """
+    flush()
+    today = timezone.localdate()
+    plan = _plan()
+    result = {}
+    fractions = []
+
+    for name, period, start in (
+        ('daily', ApiUsage.PERIOD_DAY, today),
+        ('monthly', ApiUsage.PERIOD_MONTH, today.replace(day=1)),
+    ):
+        used = ApiUsage.objects.filter(period=period, period_start=start).aggregate(
+            total=Sum('count'))['total'] or 0
+        limit = plan.get(name)
+        left = None if limit is None else max(0, limit - used)
+        result[name] = {'used': used, 'limit': limit, 'remaining': left}
+        if limit:
+            fractions.append(left / limit)
+
+    result['fraction'] = min(fractions) if fractions else None
+    return result
+
+
+def admit(requests, cost=1, state=None):
+    """
+    Kolejka priorytetowa pobrań. requests: iterowalne par (priorytet, element).
+    Zwraca (dopuszczone, odrzucone) – dopuszczone w kolejności priorytetu,
+    mieszczące się w pozostałym budżecie i powyżej progów odcinania.
+    Pozostała część budżetu jest przeliczana po każdym dopuszczonym
+    elemencie, więc duża paczka nie przekroczy progu swojego priorytetu.
+    """
+    state = state or remaining()
+    thresholds = {**DEFAULT_SHED_THRESHOLDS, **getattr(settings, 'SPORT_API_SHED_THRESHOLDS', {})}
+    # [pozostało, limit] każdego okresu z limitem
+    periods = [[p['remaining'], p['limit']] for p in (state['daily'], state['monthly'])
+               if p['remaining'] is not None]
+
+    queue = [(priority, i, item) for i, (priority, item) in enumerate(requests)]
+    heapq.heapify(queue)
+
+    admitted, shed = [], []
+    while queue:
+        priority, _, item = heapq.heappop(queue)
+        fits = all(left >= cost for left, _ in periods)
+        # Część budżetu, która zostanie po tym pobraniu – musi przekraczać próg
+        # (próg 0 = tylko twardy limit, ostatnie zapytanie też jest dozwolone)
+        threshold = thresholds.get(priority, 0.0)
+        fraction = min(((left - cost) / limit for left, limit in periods if limit), default=None)
+        allowed = fraction is None or threshold <= 0 or fraction > threshold
+        if fits and allowed:
+            admitted.append(item)
+            for period in periods:
+                period[0] -= cost
+        else:
+            shed.append(item)
+    return admitted, shed
@@ -0,0 +1,78 @@
+"""
+get_or_compute – odczyt z cache z ochroną przed "stampede".
+
+Gdy gorący klucz wygaśnie (np. strona główna w trakcie derbów), tylko
+jeden proces przelicza wartość (single-flight: blokada cache.add), a
+pozostałe w tym czasie:
+  - dostają starą wartość, jeśli jeszcze jest (stale-while-revalidate),
+  - albo czekają chwilę na wynik przeliczenia, gdy wartości nie ma wcale.
+
+Wpis w cache: {'value': ..., 'fresh_until': znacznik czasu}. Fizycznie
+żyje timeout + stale_ttl sekund – przez ostatnie stale_ttl jest "stary".
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+LOCK_KEY = '{}:compute-lock'
+
+DEFAULT_STALE_TTL = 60
+DEFAULT_LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+
+
+def _store(cache, key, value, timeout, stale_ttl):
+    entry = {'value': value, 'fresh_until': time.time() + timeout}
+    cache.set(key, entry, timeout + stale_ttl)
+
+
+def get_or_compute(key, compute, timeout, stale_ttl=None, lock_timeout=None, cache=None):
+    """
+    Wartość spod klucza albo wynik compute() (zapisany na timeout sekund).
+    Przelicza najwyżej jeden proces naraz; stale_ttl – jak długo po
+    wygaśnięciu serwujemy starą wartość, lock_timeout – czas życia blokady
+    i maksymalny czas czekania na cudze przeliczenie.
+    """
+    cache = cache or default_cache
+    stale_ttl = stale_ttl if stale_ttl is not None else getattr(settings, 'CACHE_STALE_TTL', DEFAULT_STALE_TTL)
+    lock_timeout = lock_timeout or getattr(settings, 'CACHE_COMPUTE_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+
+    entry = cache.get(key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        return entry['value']
+
+    lock_key = LOCK_KEY.format(key)
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        try:
+            value = compute()
+            _store(cache, key, value, timeout, stale_ttl)
+            return value
+        finally:
+            # Zwalniamy tylko własną blokadę (mogła wygasnąć i zostać przejęta)
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    # Ktoś inny przelicza
+    if entry is not None:
+        return entry['value']
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        if cache.get(lock_key) is None:
+            # Blokada zwolniona – wynik mógł trafić do cache tuż przed zwolnieniem
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            break
+
+    # Przeliczenie innego procesu się nie udało albo trwa za długo – liczymy sami
+    value = compute()
+    _store(cache, key, value, timeout, stale_ttl)
+    return value
@@ -0,0 +1,280 @@
+"""
+Klient SportAPI (RapidAPI) – jedno miejsce na nagłówki, pulę połączeń,
+ponawianie zapytań i zapytania warunkowe (ETag / Last-Modified).
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import archive, budget
+
+DEFAULT_HOST = "sportapi7.p.rapidapi.com"
+
+# Kody, przy których ponawiamy zapytanie
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Domyślne strojenie klienta – settings.SPORT_API_* tylko je nadpisują
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5    # sekundy
+DEFAULT_BACKOFF_MAX = 30
+DEFAULT_RATE_PER_SECOND = 5
+DEFAULT_RATE_BURST = 5
+
+# Timeout (sekundy) per endpoint; 'default' dla pozostałych
+DEFAULT_TIMEOUTS = {
+    'default': 10,
+    'live': 10,
+    'incidents': 10,
+    'lineups': 10,
+}
+
+
+class TokenBucket:
+    """
+    Limiter typu token bucket, bezpieczny wątkowo.
+    rate – tokeny na sekundę, capacity – maksymalny "wybuch" zapytań.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate musi być dodatni")
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Blokuje, aż będzie dostępny token."""
+        while True:
+            with self._lock:
+                self._refill()
+                # Tolerancja na błąd zaokrągleń – przy zegarze o małej rozdzielczości
+                # "0.9999999999999999 tokenu" oznaczałoby sen, który nie przesuwa czasu
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+_shared_bucket = None
+_shared_bucket_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Jeden limiter na proces – wspólny dla wszystkich równoległych pobrań."""
+    global _shared_bucket
+    with _shared_bucket_lock:
+        if _shared_bucket is None:
+            _shared_bucket = TokenBucket(
+                rate=getattr(settings, 'SPORT_API_RATE_PER_SECOND', DEFAULT_RATE_PER_SECOND),
+                capacity=getattr(settings, 'SPORT_API_RATE_BURST', DEFAULT_RATE_BURST),
+            )
+        return _shared_bucket
+
+
+@dataclass
+class ApiResponse:
+    """Odpowiedź API. not_modified=True: serwer zwrócił 304, data pochodzi z poprzedniej odpowiedzi."""
+    status_code: int
+    data: Any
+    not_modified: bool = False
+
+
+def _parse_retry_after(value):
+    """Retry-After: liczba sekund albo data HTTP. Zwraca sekundy lub None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class SportApiClient:
+    """
+    Klient z pulą połączeń (keep-alive) współdzieloną przez wszystkie wątki.
+
+    - ponawia 429/5xx i błędy sieci z wykładniczym backoffem z jitterem,
+      respektując nagłówek Retry-After,
+    - osobny timeout dla każdego endpointu,
+    - zapamiętuje ETag/Last-Modified i przy 304 zwraca poprzednie dane
+      z flagą not_modified (bez ponownego parsowania i zapisu).
+    """
+
+    def __init__(self, api_key=None, host=None, base_url=None, pool_size=None,
+                 max_retries=None, backoff_base=None, backoff_max=None,
+                 timeouts=None, limiter=None, usage=None, validators_size=1024, sleep=time.sleep):
+        self.host = host or os.getenv("SPORT_API_HOST") or DEFAULT_HOST
+        self.base_url = (
+            base_url or getattr(settings, 'SPORT_API_BASE_URL', None) or f"https://{self.host}/api/v1"
+        ).rstrip('/')
+        if max_retries is None:
+            max_retries = getattr(settings, 'SPORT_API_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        if backoff_base is None:
+            backoff_base = getattr(settings, 'SPORT_API_BACKOFF_BASE', DEFAULT_BACKOFF_BASE)
+        if backoff_max is None:
+            backoff_max = getattr(settings, 'SPORT_API_BACKOFF_MAX', DEFAULT_BACKOFF_MAX)
+        self.max_retries, self.backoff_base, self.backoff_max = max_retries, backoff_base, backoff_max
+        self.timeouts = {**DEFAULT_TIMEOUTS, **getattr(settings, 'SPORT_API_TIMEOUTS', {}), **(timeouts or {})}
+        self.limiter = limiter or get_rate_limiter()
+        # Licznik zużycia budżetu – każda próba (także ponowienie i 304) kosztuje
+        self.usage = usage or budget.tracker
+        self._sleep = sleep
+
+        pool_size = pool_size or getattr(settings, 'SPORT_API_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "x-rapidapi-key": api_key if api_key is not None else (os.getenv("SPORT_API_KEY") or ''),
+            "x-rapidapi-host": self.host,
+        })
+
+        # url → (etag, last_modified, data); LRU ograniczone do validators_size
+        self._validators = OrderedDict()
+        self._validators_size = validators_size
+        self._validators_lock = threading.Lock()
+
+    # --- Endpointy ---
+    # Każda nowa odpowiedź (200) trafia do archiwum surowych danych
+
+    def live_matches(self):
+        return self._archived('live', None, self.get("/sport/football/events/live", endpoint='live'))
+
+    def incidents(self, api_match_id):
+        return self._archived(
+            'incidents', api_match_id, self.get(f"/event/{api_match_id}/incidents", endpoint='incidents')
+        )
+
+    def lineups(self, api_match_id):
+        return self._archived(
+            'lineups', api_match_id, self.get(f"/event/{api_match_id}/lineups", endpoint='lineups')
+        )
+
+    def _archived(self, kind, api_match_id, response):
+        if response is not None and not response.not_modified:
+            archive.safe_store(kind, response.data, api_match_id)
+        return response
+
+    # --- Rdzeń ---
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # "Full jitter": losowo z przedziału [0, base * 2^attempt]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _conditional_headers(self, url):
+        with self._validators_lock:
+            cached = self._validators.get(url)
+        if not cached:
+            return {}
+        etag, last_modified, _ = cached
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def _remember(self, url, response, data):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        with self._validators_lock:
+            self._validators[url] = (etag, last_modified, data)
+            self._validators.move_to_end(url)
+            while len(self._validators) > self._validators_size:
+                self._validators.popitem(last=False)
+
+    def _cached_data(self, url):
+        with self._validators_lock:
+            cached = self._validators.get(url)
+        return cached[2] if cached else None
+
+    def get(self, path, endpoint='default', conditional=True) -> Optional[ApiResponse]:
+        """
+        GET na ścieżkę względem base_url. Zwraca ApiResponse albo None,
+        gdy po wszystkich próbach nie udało się pobrać danych.
+        """
+        url = f"{self.base_url}{path}"
+        timeout = self.timeouts.get(endpoint, self.timeouts['default'])
+        headers = self._conditional_headers(url) if conditional else {}
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self.usage.record(endpoint)
+            retry_after = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout)
+            except requests.RequestException as e:
+                print(f"Błąd połączenia ({endpoint}, próba {attempt + 1}): {e}")
+            else:
+                if response.status_code == 304:
+                    data = self._cached_data(url)
+                    if data is not None:
+                        return ApiResponse(304, data, not_modified=True)
+                    # Serwer uznał dane za aktualne, ale ich nie mamy – pytamy bez walidatorów
+                    headers = {}
+                    continue
+
+                if response.status_code == 200:
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        print(f"Błąd API ({endpoint}): niepoprawny JSON: {e}")
+                        return None
+                    if conditional:
+                        self._remember(url, response, data)
+                    return ApiResponse(200, data)
+
+                if response.status_code not in RETRY_STATUS_CODES:
+                    print(f"Błąd API ({endpoint}): {response.status_code}")
+                    return None
+
+                print(f"Błąd API ({endpoint}): {response.status_code}, próba {attempt + 1}")
+                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt < self.max_retries:
+                self._sleep(self._backoff(attempt, retry_after))
+
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Współdzielony klient procesu (jedna pula połączeń)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SportApiClient()
+        return _client
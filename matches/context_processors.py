@@ -0,0 +1,10 @@
+from django.conf import settings
+
+DEFAULT_FRAGMENT_CACHE_TIMEOUT = 6 * 3600
+
+
+def fragment_cache(request):
+    """Czas życia fragmentów {% cache %} szablonów (klucz z data_version unieważnia je wcześniej)."""
+    return {
+        'fragment_cache_timeout': getattr(settings, 'TEMPLATE_FRAGMENT_CACHE_TIMEOUT', DEFAULT_FRAGMENT_CACHE_TIMEOUT),
+    }
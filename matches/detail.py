@@ -0,0 +1,203 @@
+"""
+Dane strony meczu (zdarzenia, składy, boisko, brakujący gracze) jako
+dokument JSON.
+
+build_match_detail() liczy wszystko, czego potrzebuje szablon
+match_detail.html – kolejność zdarzeń, podział składów, rozstawienie na
+boisku, klasy ocen i właściwości zdarzeń (formatted_time, side,
+card_color...). Ingest zapisuje wynik w MatchDetailSnapshot przy każdej
+zmianie zdarzeń lub składów meczu, a widok renderuje prosto z niego.
+"""
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import MatchDetailSnapshot, MatchEvent, MatchLineup, MissingPlayer
+
+# Zmiana formatu dokumentu = nowa wersja; starsze snapshoty są ignorowane
+DETAIL_SNAPSHOT_VERSION = 1
+
+# Pola i właściwości MatchEvent używane w szablonie
+EVENT_FIELDS = (
+    'time', 'added_time', 'is_home_team', 'incident_class', 'player_name',
+    'assist_player_name', 'assist2_player_name', 'injury', 'reason', 'rescinded',
+    'text', 'length', 'confirmed',
+)
+EVENT_PROPERTIES = (
+    'is_goal', 'is_card', 'is_substitution', 'is_period_marker',
+    'is_injury_time_announcement', 'is_var_decision', 'formatted_time',
+    'running_score', 'incident_class_label', 'side', 'card_color',
+    'display_player_in', 'display_player_out',
+)
+PLAYER_FIELDS = ('player_name', 'shirt_number', 'position', 'is_captain', 'avg_rating')
+
+# Kolejność jak w MatchEvent.Meta.ordering / dotychczasowym widoku
+DETAIL_PREFETCHES = (
+    Prefetch('events', queryset=MatchEvent.objects.order_by('time', 'added_time', 'id')),
+    Prefetch('lineups', queryset=MatchLineup.objects.order_by('shirt_number', 'id')),
+    Prefetch('missing_players', queryset=MissingPlayer.objects.order_by('id')),
+)
+
+
+def build_pitch_data(xi_players, formation_str, is_home=True):
+    """
+    Parse formation string and assign (top%, left%) to each starting XI player.
+    Home: GK at top, attack at bottom.  Away: GK at bottom, attack at top.
+    Returns list of dicts: {player, top, left}.
+    """
+    # Parse formation: "4-3-3" → [4, 3, 3]
+    if not formation_str:
+        # Fallback: guess from position counts
+        positions = {'G': [], 'D': [], 'M': [], 'F': []}
+        for p in xi_players:
+            positions.get(p.position, positions.setdefault(p.position, [])).append(p)
+        formation_rows = []
+        for key in ['D', 'M', 'F']:
+            if positions[key]:
+                formation_rows.append(len(positions[key]))
+        formation_str = '-'.join(str(n) for n in formation_rows) if formation_rows else '4-4-2'
+
+    try:
+        rows = [int(x) for x in formation_str.split('-')]
+    except ValueError:
+        rows = [4, 4, 2]
+
+    # Group players by position: G, D, M, F
+    groups = {'G': [], 'D': [], 'M': [], 'F': []}
+    for p in xi_players:
+        pos = p.position or 'M'
+        if pos in groups:
+            groups[pos].append(p)
+        else:
+            groups['M'].append(p)
+
+    # Build row assignments: [GK] + formation rows mapped to position groups
+    # rows = [4, 3, 3] means: 4 defenders, 3 midfielders, 3 forwards
+    pos_order = ['D', 'M', 'F']
+
+    # If formation has more segments than D/M/F (e.g., 4-1-2-3 = 4 rows),
+    # we merge extra mid rows
+    all_outfield = []
+    for key in pos_order:
+        all_outfield.extend(groups[key])
+
+    # Assign players to formation rows
+    row_players = [groups['G']]  # Row 0 = GK
+    idx = 0
+    for count in rows:
+        row_players.append(all_outfield[idx:idx + count])
+        idx += count
+
+    # Vertical positions (top %) — evenly spaced
+    total_rows = len(row_players)
+    pitch_data = []
+
+    for row_idx, players_in_row in enumerate(row_players):
+        if not players_in_row:
+            continue
+
+
+        if is_home:
+            # Home: GK at left (5%), attack at right (45%)
+            # Horizontal layout: left_pct is X-axis (0-100), top_pct is Y-axis (0-100)
+            left_pct = 5 + (row_idx / max(total_rows - 1, 1)) * 40
+        else:
+            # Away: GK at right (95%), attack at left (55%)
+            left_pct = 95 - (row_idx / max(total_rows - 1, 1)) * 40
+
+        n = len(players_in_row)
+        for col_idx, player in enumerate(players_in_row):
+            # Vertical distribution (Y-axis): evenly spread
+            top_pct = (col_idx + 1) / (n + 1) * 100
+
+            # Pre-compute rating color class
+            rating_class = ''
+            if player.avg_rating:
+                try:
+                    rv = float(player.avg_rating)
+                    if rv >= 7.0:
+                        rating_class = 'rating-green'
+                    elif rv >= 6.0:
+                        rating_class = 'rating-yellow'
+                    else:
+                        rating_class = 'rating-red'
+                except (ValueError, TypeError):
+                    rating_class = 'rating-yellow'
+
+            pitch_data.append({
+                'player': player,
+                'top': round(top_pct, 1),   # Y-axis
+                'left': round(left_pct, 1), # X-axis
+                'rating_class': rating_class,
+            })
+
+    return pitch_data
+
+
+def _event_data(event):
+    data = {name: getattr(event, name) for name in EVENT_FIELDS}
+    data.update((name, getattr(event, name)) for name in EVENT_PROPERTIES)
+    return data
+
+
+def _player_data(player):
+    data = {name: getattr(player, name) for name in PLAYER_FIELDS}
+    data['position_label'] = player.position_label
+    return data
+
+
+def build_match_detail(match):
+    """
+    Dokument strony meczu (słowniki, gotowe do zapisu jako JSON). Korzysta
+    z match.events / lineups / missing_players – z DETAIL_PREFETCHES nie
+    wykonuje dodatkowych zapytań.
+    """
+    lineups = {'home_xi': [], 'home_subs': [], 'away_xi': [], 'away_subs': []}
+    for player in match.lineups.all():
+        side = 'home' if player.is_home_team else 'away'
+        lineups[f"{side}_{'xi' if player.is_starting_xi else 'subs'}"].append(player)
+
+    pitch = {}
+    for side, formation in (('home', match.home_formation), ('away', match.away_formation)):
+        pitch[side] = [
+            {**item, 'player': _player_data(item['player'])}
+            for item in build_pitch_data(lineups[f'{side}_xi'], formation, is_home=side == 'home')
+        ]
+
+    missing = {'home': [], 'away': []}
+    for player in match.missing_players.all():
+        missing['home' if player.is_home_team else 'away'].append(
+            {'player_name': player.player_name, 'type': player.type}
+        )
+
+    return {
+        'events': [_event_data(event) for event in match.events.all()],
+        'lineups': {key: [_player_data(p) for p in players] for key, players in lineups.items()},
+        'pitch_home': pitch['home'],
+        'pitch_away': pitch['away'],
+        'missing_home': missing['home'],
+        'missing_away': missing['away'],
+    }
+
+
+def rebuild_detail_snapshot(match):
+    """Buduje i zapisuje snapshot strony meczu (3 zapytania + zapis)."""
+    for lookup in ('events', 'lineups', 'missing_players'):
+        # Świeże dane – nie korzystamy z ewentualnego starego prefetchu
+        getattr(match, '_prefetched_objects_cache', {}).pop(lookup, None)
+    prefetch_related_objects([match], *DETAIL_PREFETCHES)
+
+    snapshot, _ = MatchDetailSnapshot.objects.update_or_create(
+        match=match,
+        defaults={'version': DETAIL_SNAPSHOT_VERSION, 'data': build_match_detail(match)},
+    )
+    return snapshot
+
+
+def load_match_detail(match):
+    """Dokument ze snapshotu albo None (brak lub starsza wersja formatu)."""
+    try:
+        snapshot = match.detail_snapshot
+    except MatchDetailSnapshot.DoesNotExist:
+        return None
+    if snapshot.version != DETAIL_SNAPSHOT_VERSION:
+        return None
+    return snapshot.data
@@ -0,0 +1,71 @@
+"""
+Współbieżne pobieranie szczegółów meczów (incidents + lineups).
+
+Wątki nie wykonują zapytań do bazy. Poza zapytaniem HTTP każde wywołanie
+client.<endpoint> w wątku:
+  - zapisuje surową odpowiedź do archiwum (archive.safe_store – plik
+    tymczasowy + rename, nazwa z treści, więc wątki sobie nie przeszkadzają),
+  - dolicza zapytanie do bufora zużycia budżetu w pamięci (budget.tracker,
+    pod blokadą; do ApiUsage zapisuje go dopiero flush()),
+  - aktualizuje cache walidatorów ETag klienta (pod blokadą).
+Wyniki wracają do wątku wywołującego, który jako jedyny zapisuje dane
+meczów (patrz services.ingest_many_match_details).
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from django.conf import settings
+
+from .client import get_client
+
+# Endpointy pobierane dla każdego meczu
+DETAIL_ENDPOINTS = ('incidents', 'lineups')
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+@dataclass
+class MatchDetails:
+    """Surowe odpowiedzi API dla jednego meczu (None = błąd pobierania)."""
+    match: Any
+    incidents: Optional[dict] = None
+    lineups: Optional[dict] = None
+    # Endpointy, dla których serwer odpowiedział 304 (dane bez zmian)
+    not_modified: set = field(default_factory=set)
+
+
+def fetch_many_details(matches, max_workers=None, client=None):
+    """
+    Generator: pobiera incidents i lineups dla wszystkich meczów równolegle
+    i zwraca MatchDetails, gdy oba zapytania danego meczu się zakończą.
+
+    max_workers ogranicza liczbę zapytań "w locie"; tempo zapytań kontroluje
+    limiter klienta. Kolejność wyników odpowiada kolejności ukończenia.
+    """
+    max_workers = max_workers or getattr(settings, 'SPORT_API_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)
+    client = client or get_client()
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for match in matches:
+            if match.api_id in pending:
+                continue
+            pending[match.api_id] = [MatchDetails(match=match), len(DETAIL_ENDPOINTS)]
+            for endpoint in DETAIL_ENDPOINTS:
+                future = executor.submit(getattr(client, endpoint), match.api_id)
+                futures[future] = (match.api_id, endpoint)
+
+        for future in as_completed(futures):
+            api_id, endpoint = futures[future]
+            entry = pending[api_id]
+            response = future.result()
+            if response is not None:
+                setattr(entry[0], endpoint, response.data)
+                if response.not_modified:
+                    entry[0].not_modified.add(endpoint)
+            entry[1] -= 1
+            if entry[1] == 0:
+                del pending[api_id]
+                yield entry[0]
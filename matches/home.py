@@ -0,0 +1,122 @@
+"""
+Drzewo kraj → liga → mecze dla strony głównej.
+
+- Tylko istotne mecze: trwające lub zaplanowane (state, bez zawieszonych
+  – status.current_q) albo grane dzisiaj (kickoff_at od północy do północy).
+- Jedno wąskie zapytanie .values() – bez obiektów modeli i bez JOIN-ów
+  poza ligą i drużynami.
+- Wynik w cache pod kluczem z numerem wersji; sync_live_matches podbija
+  wersję przy każdej zmianie meczów, więc stare drzewo po prostu wygasa.
+  Przeliczenie chroni get_or_compute (jeden proces naraz).
+- ?league=<nazwa> (wynik wyszukiwarki) zawęża drzewo z cache do tej ligi
+  (league_subtree) – zamiast stronicowania po krajach.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from . import snapshot, status as match_status
+from .aggregates import AGGREGATE_FIELDS
+from .caching import get_or_compute
+from .models import LiveMatch
+
+HOME_VERSION_KEY = 'home:tree:version'
+HOME_TREE_KEY = 'home:tree:{}'
+
+DEFAULT_TREE_TIMEOUT = 300
+DEFAULT_COUNTRIES_PER_PAGE = 20
+
+# Kolumny potrzebne stronie głównej
+MATCH_ROW_FIELDS = (
+    'id', 'data_version', 'status', 'home_score', 'away_score', 'country_name',
+    'league__name', 'league__country', 'home_team__name', 'away_team__name',
+    *AGGREGATE_FIELDS,
+)
+
+
+def home_version():
+    return cache.get_or_set(HOME_VERSION_KEY, 1, timeout=None)
+
+
+def bump_home_version():
+    """Unieważnia drzewo strony głównej (wywoływane przez sync)."""
+    try:
+        return cache.incr(HOME_VERSION_KEY)
+    except ValueError:
+        # Klucza jeszcze nie ma (np. pusty cache po restarcie)
+        cache.set(HOME_VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def relevant_matches(now=None):
+    """Mecze trwające lub zaplanowane i dzisiejsze – oba warunki po indeksach (state, kickoff_at)."""
+    now = timezone.localtime(now or timezone.now())
+    today_start = timezone.make_aware(datetime.combine(now.date(), time.min))
+    return LiveMatch.objects.filter(
+        match_status.current_q(match_status.ACTIVE_STATES, now)
+        | Q(kickoff_at__gte=today_start, kickoff_at__lt=today_start + timedelta(days=1))
+    )
+
+
+def build_home_tree(now=None):
+    """
+    Drzewo [{'country', 'leagues': [{'name', 'matches': [...]}]}] posortowane
+    po kraju i lidze + lista nazw lig do filtra. Mecze to słowniki z .values().
+    """
+    rows = relevant_matches(now).order_by('id').values(*MATCH_ROW_FIELDS)
+
+    raw_data = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        country = row['country_name'] or row['league__country'] or 'Inne'
+        league = row['league__name'] or 'Nieznana Liga'
+        raw_data[country][league].append({
+            'id': row['id'],
+            'data_version': row['data_version'],
+            'status': row['status'],
+            'home_score': row['home_score'],
+            'away_score': row['away_score'],
+            'home_team_name': row['home_team__name'],
+            'away_team_name': row['away_team__name'],
+            # Odznaki na liście (kartki, ostatnie zdarzenie) – z liczników meczu
+            **{field: row[field] for field in AGGREGATE_FIELDS},
+        })
+
+    tree = [
+        {
+            'country': country,
+            'leagues': [{'name': name, 'matches': matches} for name, matches in sorted(leagues.items())],
+        }
+        for country, leagues in sorted(raw_data.items())
+    ]
+    league_names = sorted({league['name'] for item in tree for league in item['leagues']})
+    return {'tree': tree, 'all_league_names': league_names}
+
+
+def league_subtree(tree, league_name):
+    """
+    Drzewo ograniczone do jednej ligi (link ?league= z wyszukiwarki) – kraje
+    bez tej ligi odpadają, więc liga nie ginie na dalszej stronie krajów.
+    """
+    subtree = []
+    for item in tree:
+        leagues = [league for league in item['leagues'] if league['name'] == league_name]
+        if leagues:
+            subtree.append({'country': item['country'], 'leagues': leagues})
+    return subtree
+
+
+def get_home_tree():
+    """
+    Drzewo z cache (klucz z bieżącą wersją) albo zbudowane od nowa – po
+    podbiciu wersji przelicza je tylko jeden proces (get_or_compute),
+    czytając z bazy głównej (snapshot może być starszy niż wersja).
+    """
+    return get_or_compute(
+        HOME_TREE_KEY.format(home_version()),
+        lambda: snapshot.from_primary(build_home_tree),
+        timeout=getattr(settings, 'HOME_TREE_CACHE_TIMEOUT', DEFAULT_TREE_TIMEOUT),
+    )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from matches import budget
+from matches.models import ApiUsage
+
+
+class Command(BaseCommand):
+    help = 'Pokazuje zużycie i pozostały budżet zapytań do SportAPI (dzień / miesiąc).'
+
+    def handle(self, *args, **options):
+        state = budget.remaining()
+
+        for name, label in (('daily', 'Dziś'), ('monthly', 'Ten miesiąc')):
+            period = state[name]
+            limit = period['limit'] if period['limit'] is not None else '∞'
+            left = period['remaining'] if period['remaining'] is not None else '∞'
+            self.stdout.write(f"{label}: {period['used']} / {limit} (pozostało: {left})")
+
+        today = timezone.localdate()
+        usage = ApiUsage.objects.filter(
+            period=ApiUsage.PERIOD_MONTH, period_start=today.replace(day=1)
+        ).order_by('-count')
+        for row in usage:
+            self.stdout.write(f"  {row.endpoint}: {row.count}")
+
+        if state['fraction'] is not None:
+            style = self.style.SUCCESS if state['fraction'] > 0.2 else self.style.WARNING
+            self.stdout.write(style(f"Pozostało {state['fraction']:.0%} budżetu."))
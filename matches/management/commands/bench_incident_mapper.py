@@ -0,0 +1,79 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from matches import archive
+from matches.services import _map_incident, map_incidents
+
+
+class Command(BaseCommand):
+    help = (
+        'Mikro-benchmark mapowania zdarzeń: _map_incident (per element) vs map_incidents (wsadowo)\n'
+        'na nagranym korpusie – domyślnie wszystkie odpowiedzi /incidents z archiwum surowych danych.\n'
+        'Najpierw sprawdza, czy oba mapowania dają identyczny wynik.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corpus', type=str, default=None,
+            help='Plik .json.gz lub katalog z plikami .json.gz (domyślnie: <RAW_ARCHIVE_DIR>/incidents).'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Liczba powtórzeń (liczy się najlepszy czas).')
+        parser.add_argument(
+            '--min-speedup', type=float, default=None,
+            help='Zakończ błędem, jeśli przyspieszenie wsadowego mapowania jest mniejsze (np. 1.2).'
+        )
+
+    def _load_corpus(self, corpus):
+        root = Path(corpus) if corpus else archive.archive_root() / 'incidents'
+        if root.is_file():
+            paths = [root]
+        elif root.is_dir():
+            paths = sorted(root.rglob('*.json.gz'))
+        else:
+            raise CommandError(f"Korpus nie istnieje: {root}")
+
+        items = []
+        for path in paths:
+            items.extend(archive.load(path).get('incidents', []))
+        if not items:
+            raise CommandError(f"Brak zdarzeń w korpusie: {root}")
+        return items, len(paths)
+
+    @staticmethod
+    def _best_time(func, items, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(items)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        items, files = self._load_corpus(options['corpus'])
+        repeat = max(1, options['repeat'])
+        self.stdout.write(f"Korpus: {len(items)} zdarzeń z {files} plików.")
+
+        # 1. Zgodność wyników
+        expected = [_map_incident(item) for item in items]
+        actual = map_incidents(items)
+        mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+        if mismatches:
+            first = mismatches[0]
+            raise CommandError(
+                f"Wyniki różnią się dla {len(mismatches)} zdarzeń, np. #{first}:\n"
+                f"  _map_incident: {expected[first]}\n  map_incidents: {actual[first]}"
+            )
+
+        # 2. Czas
+        per_item = self._best_time(lambda xs: [_map_incident(x) for x in xs], items, repeat)
+        batch = self._best_time(map_incidents, items, repeat)
+        speedup = per_item / batch if batch else float('inf')
+
+        self.stdout.write(f"_map_incident : {per_item * 1000:8.2f} ms  ({len(items) / per_item:,.0f} zdarzeń/s)")
+        self.stdout.write(f"map_incidents : {batch * 1000:8.2f} ms  ({len(items) / batch:,.0f} zdarzeń/s)")
+        self.stdout.write(self.style.SUCCESS(f"Przyspieszenie: x{speedup:.2f}"))
+
+        if options['min_speedup'] is not None and speedup < options['min_speedup']:
+            raise CommandError(f"Przyspieszenie x{speedup:.2f} poniżej progu x{options['min_speedup']:.2f}.")
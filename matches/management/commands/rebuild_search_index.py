@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from matches import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Przebudowuje indeks wyszukiwarki (drużyny, ligi, gracze) z aktualną popularnością.\n'
+        'Opcja --bench mierzy czas zapytań (p50/p99) na gotowym indeksie, bez cache;\n'
+        'z --max-p99-ms kończy się błędem po przekroczeniu celu (10 ms przy 100 tys. obiektów).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bench', action='store_true', help='Tylko pomiar czasu zapytań, bez przebudowy.')
+        parser.add_argument('--queries', type=str, default='le,gor,real ma,bayern,fc,sa,ja,mu',
+                            help='Zapytania do pomiaru, oddzielone przecinkami.')
+        parser.add_argument('--repeat', type=int, default=200, help='Liczba powtórzeń każdego zapytania.')
+        parser.add_argument(
+            '--max-p99-ms', type=float, default=None,
+            help='Zakończ błędem, jeśli p99 przekroczy tę wartość (np. 10).'
+        )
+
+    def handle(self, *args, **options):
+        if options['bench']:
+            self._bench(options['queries'].split(','), options['repeat'], options['max_p99_ms'])
+            return
+
+        started = time.monotonic()
+        stats = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Gotowe! Przeindeksowano drużyn: {stats['teams']}, lig: {stats['leagues']}, "
+            f"graczy: {stats['players']}, usunięto wpisów: {stats['removed']} "
+            f"({time.monotonic() - started:.1f} s)."
+        ))
+
+    def _bench(self, queries, repeat, max_p99_ms=None):
+        # Rozgrzewka – pierwsze zapytania czytają strony indeksu z dysku
+        for query in queries:
+            search.search(query, use_cache=False)
+        timings = []
+        for query in queries:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                search.search(query, use_cache=False)
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1000
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+        self.stdout.write(f"Zapytań: {len(timings)} | p50 {p50:.2f} ms | p99 {p99:.2f} ms")
+        if max_p99_ms is not None and p99 > max_p99_ms:
+            raise CommandError(f"p99 {p99:.2f} ms przekracza cel {max_p99_ms:g} ms.")
@@ -1,13 +1,33 @@
-from django.core.management.base import BaseCommand
-from matches.models import LiveMatch, MatchEvent, MatchLineup
-from matches.services import fetch_match_details
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from matches.budget import PRIORITY_BACKFILL
+from matches.models import LiveMatch
+from matches.services import ingest_many_match_details, replay_match_from_archive
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
 
 
 class Command(BaseCommand):
     help = (
-        'Usuwa stare zdarzenia i składy, a następnie ponownie pobiera je z API.\n'
-        'Użycie: python manage.py reimport_events [match_id ...]\n'
-        'Bez argumentów: reimportuje WSZYSTKIE mecze.'
+        'Ponownie pobiera zdarzenia i składy z API; stare dane meczu są podmieniane\n'
+        'w jednej transakcji dopiero po pobraniu nowych.\n'
+        'Użycie: python manage.py reimport_events [match_id ...] [--from-archive] '
+        '[--workers N] [--batch-size N] [--resume]\n'
+        'Bez argumentów: reimportuje WSZYSTKIE mecze. Postęp zapisywany jest po każdej\n'
+        'paczce w pliku checkpointu – po przerwaniu --resume kontynuuje od miejsca przerwania.\n'
+        'Mecze nieudane lub pominięte (budżet API) trafiają do checkpointu; komenda kończy\n'
+        'się wtedy błędem, a --resume pobiera je ponownie.'
     )
 
     def add_arguments(self, parser):
@@ -15,31 +35,161 @@ class Command(BaseCommand):
             'match_ids', nargs='*', type=int,
             help='ID meczów do reimportu (lokalne ID). Puste = wszystkie.'
         )
+        parser.add_argument(
+            '--from-archive', action='store_true',
+            help='Odtwarza dane z lokalnego archiwum surowych odpowiedzi (bez zapytań do API).'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Liczba równoległych zapytań do API (domyślnie SPORT_API_MAX_IN_FLIGHT).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Liczba meczów w jednej paczce; checkpoint zapisywany jest po każdej paczce.'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Kontynuuje przerwany reimport od ostatniego checkpointu (także ponawia pominięte mecze).'
+        )
+        parser.add_argument(
+            '--checkpoint', type=str, default=None,
+            help='Plik checkpointu (domyślnie: <BASE_DIR>/reimport_events.checkpoint.json).'
+        )
+
+    # --- Checkpoint ---
+
+    def _checkpoint_path(self, options):
+        if options['checkpoint']:
+            return Path(options['checkpoint'])
+        return Path(settings.BASE_DIR) / 'reimport_events.checkpoint.json'
+
+    def _load_checkpoint(self, path, job):
+        try:
+            with open(path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"Brak checkpointu do wznowienia: {path}")
+        except ValueError as e:
+            raise CommandError(f"Uszkodzony checkpoint {path}: {e}")
+        if checkpoint.get('job') != job:
+            raise CommandError(
+                f"Checkpoint {path} dotyczy innego zadania ({checkpoint.get('job')}). "
+                f"Uruchom bez --resume, aby zacząć od nowa."
+            )
+        return checkpoint
+
+    @staticmethod
+    def _save_checkpoint(path, checkpoint):
+        # Zapis atomowy – przerwanie w trakcie zapisu nie psuje checkpointu
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, path)
+
+    # --- Główna pętla ---
 
     def handle(self, *args, **options):
         match_ids = options['match_ids']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size musi być dodatni.")
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers musi być dodatni.")
 
-        if match_ids:
-            matches = LiveMatch.objects.filter(id__in=match_ids)
+        path = self._checkpoint_path(options)
+        job = {'match_ids': sorted(match_ids), 'from_archive': options['from_archive']}
+
+        if options['resume']:
+            checkpoint = self._load_checkpoint(path, job)
+            checkpoint.setdefault('retry_ids', [])
+            self.stdout.write(
+                f"Wznawiam reimport po meczu ID {checkpoint['last_id']} "
+                f"(przetworzono już {checkpoint['processed']} meczów, "
+                f"do ponowienia: {len(checkpoint['retry_ids'])})."
+            )
         else:
-            matches = LiveMatch.objects.all()
+            if path.exists():
+                self.stdout.write(self.style.WARNING(f"Nadpisuję istniejący checkpoint: {path}"))
+            checkpoint = {
+                'job': job, 'last_id': 0, 'processed': 0, 'retry_ids': [],
+                'stats': {'incidents': 0, 'lineups': 0, 'failed': 0, 'shed': 0, 'missing': 0},
+            }
 
-        total = matches.count()
-        self.stdout.write(f"Reimport zdarzeń dla {total} meczów...")
+        # Mecze po ostatnim ukończonym ID i wcześniej pominięte (nieudane / budżet API)
+        matches = LiveMatch.objects.filter(Q(id__gt=checkpoint['last_id']) | Q(id__in=checkpoint['retry_ids']))
+        if match_ids:
+            matches = matches.filter(id__in=match_ids)
 
-        for i, match in enumerate(matches, 1):
-            self.stdout.write(f"\n[{i}/{total}] Mecz: {match} (local_id={match.id}, api_id={match.api_id})")
+        # Kolejność po ID – checkpoint to ostatnie ukończone ID + lista do ponowienia
+        matches = list(matches.select_related('home_team', 'away_team').order_by('id'))
+        total = len(matches)
+        self.stdout.write(f"Reimport zdarzeń dla {total} meczów (paczki po {batch_size})...")
 
-            # Usuwamy stare dane
-            deleted_events = MatchEvent.objects.filter(match=match).delete()[0]
-            deleted_lineups = MatchLineup.objects.filter(match=match).delete()[0]
-            self.stdout.write(f"  Usunięto: {deleted_events} zdarzeń, {deleted_lineups} składów")
+        stats = checkpoint['stats']
+        retry_ids = set(checkpoint['retry_ids'])
+        started = time.monotonic()
+        done = 0
 
-            # Pobieramy na nowo
-            result = fetch_match_details(match.id, match.api_id)
-            if result:
-                self.stdout.write(self.style.SUCCESS(f"  ✓ Reimport zakończony."))
+        for start in range(0, total, batch_size):
+            batch = matches[start:start + batch_size]
+            if options['from_archive']:
+                stats['missing'] += self._replay(batch)
             else:
-                self.stdout.write(self.style.ERROR(f"  ✗ Błąd importu."))
+                # Pobieranie równoległe, zapis w tym wątku; dane meczu są
+                # podmieniane w jednej transakcji dopiero po pobraniu nowych.
+                result = ingest_many_match_details(
+                    batch, replace=True, priority=PRIORITY_BACKFILL, max_workers=options['workers']
+                )
+                for key in ('incidents', 'lineups', 'failed', 'shed'):
+                    stats[key] += result[key]
+                retry_ids.difference_update(m.id for m in batch)
+                retry_ids.update(result['skipped_ids'])
+
+            done += len(batch)
+            checkpoint['last_id'] = max(checkpoint['last_id'], batch[-1].id)
+            checkpoint['processed'] += len(batch)
+            checkpoint['retry_ids'] = sorted(retry_ids)
+            self._save_checkpoint(path, checkpoint)
+            self._progress(done, total, started)
+
+        # Checkpoint zostaje, dopóki są mecze do ponowienia
+        if not retry_ids and path.exists():
+            path.unlink()
+
+        if options['from_archive']:
+            self.stdout.write(self.style.SUCCESS(
+                f"\nGotowe! Odtworzono {checkpoint['processed'] - stats['missing']} meczów z archiwum "
+                f"(bez danych: {stats['missing']})."
+            ))
+            return
+
+        self.stdout.write(
+            f"Zdarzenia: {stats['incidents']}, składy: {stats['lineups']}, błędy: {stats['failed']}, "
+            f"pominięte (budżet API): {stats['shed']}"
+        )
+        if retry_ids:
+            raise CommandError(
+                f"Nie przetworzono {len(retry_ids)} meczów (błąd pobierania albo budżet API). "
+                f"Uruchom ponownie z --resume, aby je pobrać (checkpoint: {path})."
+            )
+        self.stdout.write(self.style.SUCCESS(f"\nGotowe! Przetworzono {checkpoint['processed']} meczów."))
+
+    def _progress(self, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else 0.0
+        self.stdout.write(
+            f"[{done}/{total}] {done * 100 // total}% | {rate:.2f} meczów/s | "
+            f"upłynęło {_format_duration(elapsed)} | ETA {_format_duration(eta)}"
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"\nGotowe! Przetworzono {total} meczów."))
+    def _replay(self, matches):
+        """Odtwarza paczkę meczów z archiwum. Zwraca liczbę meczów bez danych."""
+        missing = 0
+        for match in matches:
+            if not replay_match_from_archive(match):
+                missing += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{match} (api_id={match.api_id}): brak danych w archiwum."
+                ))
+        return missing
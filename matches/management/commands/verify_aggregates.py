@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from matches.aggregates import verify_aggregates
+from matches.models import LiveMatch
+
+
+class Command(BaseCommand):
+    help = (
+        'Przelicza liczniki zdarzeń meczów (gole, kartki, ostatnia minuta) hurtowo\n'
+        'i naprawia rozbieżności z zapisanymi wartościami.\n'
+        'Użycie: python manage.py verify_aggregates [match_id ...] [--dry-run] [--batch-size N]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'match_ids', nargs='*', type=int,
+            help='ID meczów do sprawdzenia (lokalne ID). Puste = wszystkie.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Tylko raport – bez zapisu poprawionych liczników.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Liczba meczów przeliczanych jednym zapytaniem GROUP BY.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size musi być dodatni.")
+        repair = not options['dry_run']
+
+        matches = LiveMatch.objects.order_by('id')
+        if options['match_ids']:
+            matches = matches.filter(id__in=options['match_ids'])
+        match_ids = list(matches.values_list('id', flat=True))
+
+        started = time.monotonic()
+        drifted = []
+        for start in range(0, len(match_ids), batch_size):
+            drifted.extend(verify_aggregates(match_ids[start:start + batch_size], repair=repair))
+
+        for match_id in drifted[:20]:
+            self.stdout.write(self.style.WARNING(f"Rozbieżne liczniki: mecz ID {match_id}"))
+        if len(drifted) > 20:
+            self.stdout.write(self.style.WARNING(f"... i {len(drifted) - 20} kolejnych."))
+
+        summary = f"rozbieżności: {len(drifted)}"
+        if drifted:
+            summary += ' – naprawione' if repair else ' – bez zapisu (--dry-run)'
+        self.stdout.write(self.style.SUCCESS(
+            f"\nGotowe! Sprawdzono {len(match_ids)} meczów w {time.monotonic() - started:.1f} s, {summary}."
+        ))
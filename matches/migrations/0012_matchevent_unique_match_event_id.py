@@ -0,0 +1,38 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+def remove_duplicate_events(apps, schema_editor):
+    """Przed dodaniem ograniczenia zostawiamy najstarszy rekord z każdej pary (match, event_id)."""
+    MatchEvent = apps.get_model('matches', 'MatchEvent')
+    seen = set()
+    duplicates = []
+    rows = (
+        MatchEvent.objects.exclude(event_id__isnull=True).exclude(event_id='')
+        .order_by('match_id', 'event_id', 'id')
+        .values_list('id', 'match_id', 'event_id')
+    )
+    for pk, match_id, event_id in rows.iterator():
+        key = (match_id, event_id)
+        if key in seen:
+            duplicates.append(pk)
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        MatchEvent.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0011_missingplayer'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_events, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='matchevent',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_id__isnull', False), models.Q(('event_id', ''), _negated=True)), fields=('match', 'event_id'), name='unique_match_event_id'),
+        ),
+    ]
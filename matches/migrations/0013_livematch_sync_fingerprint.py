@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0012_matchevent_unique_match_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='sync_fingerprint',
+            field=models.CharField(blank=True, help_text='Skrót pól z live feedu – pozwala pominąć zapis bez zmian', max_length=40, null=True),
+        ),
+    ]
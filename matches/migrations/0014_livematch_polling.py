@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0013_livematch_sync_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Kiedy scheduler ma ponownie pobrać szczegóły (NULL = nigdy)', null=True),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='period_started_at',
+            field=models.DateTimeField(blank=True, help_text='Początek bieżącej połowy (z live feedu)', null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0014_livematch_polling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50)),
+                ('period', models.CharField(choices=[('day', 'Dzień'), ('month', 'Miesiąc')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('endpoint', 'period', 'period_start')},
+            },
+        ),
+    ]
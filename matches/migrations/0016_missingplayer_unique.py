@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-18 18:59
+
+from django.db import migrations
+
+
+def remove_duplicate_missing_players(apps, schema_editor):
+    """Przed dodaniem klucza zostawiamy najstarszy rekord z każdej trójki (match, player_name, is_home_team)."""
+    MissingPlayer = apps.get_model('matches', 'MissingPlayer')
+    seen = set()
+    duplicates = []
+    rows = (
+        MissingPlayer.objects.order_by('match_id', 'player_name', 'is_home_team', 'id')
+        .values_list('id', 'match_id', 'player_name', 'is_home_team')
+    )
+    for pk, *key in rows.iterator():
+        key = tuple(key)
+        if key in seen:
+            duplicates.append(pk)
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        MissingPlayer.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0015_apiusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_missing_players, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='missingplayer',
+            unique_together={('match', 'player_name', 'is_home_team')},
+        ),
+    ]
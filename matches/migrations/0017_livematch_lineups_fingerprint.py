@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0016_missingplayer_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='lineups_fingerprint',
+            field=models.CharField(blank=True, help_text='Skrót ostatniej odpowiedzi /lineups – pozwala pominąć odświeżenie bez zmian', max_length=40, null=True),
+        ),
+    ]
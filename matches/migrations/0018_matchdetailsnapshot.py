@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0017_livematch_lineups_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchDetailSnapshot',
+            fields=[
+                ('match', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail_snapshot', serialize=False, to='matches.livematch')),
+                ('version', models.PositiveSmallIntegerField(help_text='Wersja formatu dokumentu')),
+                ('data', models.JSONField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
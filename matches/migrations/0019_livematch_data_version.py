@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0018_matchdetailsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, help_text='Podbijana przy każdej zmianie meczu, zdarzeń lub składów – klucz fragmentów w cache szablonów'),
+        ),
+    ]
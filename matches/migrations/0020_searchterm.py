@@ -0,0 +1,36 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0019_livematch_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='matchlineup',
+            name='player_api_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('team', 'Drużyna'), ('league', 'Liga'), ('player', 'Gracz')], max_length=10)),
+                ('object_id', models.IntegerField(help_text='ID drużyny/ligi, dla gracza – player_api_id')),
+                ('position', models.PositiveSmallIntegerField(help_text='Numer słowa, od którego zaczyna się term (0 = cała nazwa)')),
+                ('term', models.CharField(max_length=255)),
+                ('name', models.CharField(help_text='Nazwa do wyświetlenia', max_length=255)),
+                ('url', models.CharField(blank=True, max_length=255, null=True)),
+                ('logo_url', models.URLField(blank=True, null=True)),
+                ('popularity', models.PositiveIntegerField(default=0, help_text='Liczba meczów (gracz: występów) – ranking wyników')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'term', 'position', 'popularity'], name='search_kind_term_idx')],
+                'unique_together': {('kind', 'object_id', 'position')},
+            },
+        ),
+    ]
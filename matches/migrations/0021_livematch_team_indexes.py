@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0020_searchterm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='livematch',
+            name='away_team',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='away_matches', to='matches.team'),
+        ),
+        migrations.AlterField(
+            model_name='livematch',
+            name='home_team',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='home_matches', to='matches.team'),
+        ),
+        migrations.AddIndex(
+            model_name='livematch',
+            index=models.Index(fields=['home_team', 'id'], name='livematch_home_team_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='livematch',
+            index=models.Index(fields=['away_team', 'id'], name='livematch_away_team_id_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:19
+
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+# Kopia reguł z matches.status z chwili tworzenia migracji – migracja nie
+# może zależeć od kodu, który później się zmieni
+DESCRIPTION_MARKERS = (
+    ('postponed', ('postponed',)),
+    ('cancelled', ('canceled', 'cancelled', 'abandoned', 'removed')),
+    ('finished', ('ended', 'finished', 'after')),
+    ('interrupted', ('interrupted', 'suspended', 'delayed')),
+    ('half_time', ('halftime', 'half time', 'break', 'pause', 'awaiting')),
+    ('in_play', ('half', 'extra', 'penalties', 'overtime')),
+)
+FINISHED_CODES = ('ft', 'aet', 'ap')
+LIVE_STATES = ('in_play', 'half_time', 'interrupted')
+
+# Mecz "na żywo" dłużej niż tyle po początku na pewno się skończył
+STALE_AFTER = timedelta(hours=4)
+
+
+def state_from_description(description):
+    """Opis statusu (status.description) → stan."""
+    text = (description or '').strip().lower()
+    if not text or text == 'not started':
+        return 'not_started'
+    if text in FINISHED_CODES:
+        return 'finished'
+    for state, markers in DESCRIPTION_MARKERS:
+        if any(marker in text for marker in markers):
+            return state
+    return 'not_started'
+
+
+def backfill_state_and_kickoff(apps, schema_editor):
+    """
+    Stan z zapisanego opisu statusu – jedno UPDATE na każdy różny opis.
+    Starych meczów bez startTimestamp nie da się uzupełnić dokładnie:
+    kickoff_at = period_started_at (ten sam dzień meczu wystarcza filtrom).
+    Stare mecze zapisane jako "1st half"/"2nd half", które nigdy nie dostały
+    statusu końcowego, zamykamy – gdy zaczęły się dawno albo nie wiadomo kiedy.
+    """
+    LiveMatch = apps.get_model('matches', 'LiveMatch')
+    descriptions = LiveMatch.objects.order_by().values_list('status', flat=True).distinct()
+    for description in list(descriptions):
+        LiveMatch.objects.filter(status=description).update(state=state_from_description(description))
+    LiveMatch.objects.filter(kickoff_at__isnull=True).update(kickoff_at=F('period_started_at'))
+
+    cutoff = datetime.now(timezone.utc) - STALE_AFTER
+    LiveMatch.objects.filter(
+        Q(kickoff_at__isnull=True) | Q(kickoff_at__lt=cutoff), state__in=LIVE_STATES,
+    ).update(state='finished')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0021_livematch_team_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='kickoff_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Planowy początek meczu (startTimestamp z API)', null=True),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='state',
+            field=models.CharField(choices=[('not_started', 'Nie rozpoczęty'), ('in_play', 'W trakcie'), ('half_time', 'Przerwa'), ('interrupted', 'Przerwany'), ('finished', 'Zakończony'), ('postponed', 'Przełożony'), ('cancelled', 'Odwołany')], default='not_started', help_text='Znormalizowany stan meczu (matches.status) – do filtrów i indeksów', max_length=20),
+        ),
+        migrations.RunPython(backfill_state_and_kickoff, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='livematch',
+            index=models.Index(fields=['state', 'kickoff_at'], name='livematch_state_kickoff_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:21
+
+from django.db import migrations, transaction
+from django.db.models import F, Max, Q, Value
+from django.db.models.functions import Coalesce, NullIf
+
+# Zakres ID zdarzeń przepisywany w jednej transakcji
+BATCH_SIZE = 5000
+
+LEGACY_GOAL_TYPES = ('regular', 'penalty', 'ownGoal')
+LEGACY_CARD_TYPES = ('yellow', 'yellowRed', 'red')
+
+
+def _class_from_type():
+    """incident_class, a gdy pusty – stary incident_type (tam API trzymało incidentClass)."""
+    return Coalesce(NullIf(F('incident_class'), Value('')), F('incident_type'))
+
+
+def canonicalize_batch(events):
+    """
+    Przepisuje stare wiersze w postać kanoniczną – te same reguły, według
+    których rozpoznawały je dawne właściwości MatchEvent. Zwraca liczbę
+    zmienionych wierszy.
+    """
+    changed = 0
+    # Gol: incident_type = incidentClass, z prawdziwym strzelcem
+    changed += (
+        events.filter(incident_type__in=LEGACY_GOAL_TYPES)
+        .exclude(Q(player_name__isnull=True) | Q(player_name='') | Q(player_name='Nieznany'))
+        .update(incident_type='goal', incident_class=_class_from_type())
+    )
+    # Kartka: incident_type = kolor
+    changed += events.filter(incident_type__in=LEGACY_CARD_TYPES).update(
+        incident_type='card', incident_class=_class_from_type()
+    )
+    # Marker HT/FT: 'Unknown' z addedTime=999 (added_time zostaje – decyduje o kolejności)
+    changed += events.filter(incident_type='Unknown', added_time__gte=900).update(incident_type='period')
+    # Zmiana: gracz wchodzący zapisany tylko w player_name
+    changed += (
+        events.filter(incident_type='substitution')
+        .filter(Q(player_in_name__isnull=True) | Q(player_in_name=''))
+        .update(player_in_name=F('player_name'))
+    )
+    return changed
+
+
+def canonicalize_legacy_events(apps, schema_editor):
+    """
+    Paczkami po BATCH_SIZE ID, każda we własnej transakcji (migracja nie
+    jest atomowa). Przepisane wiersze nie pasują już do żadnej reguły, więc
+    przerwaną migrację wystarczy uruchomić ponownie – dokończy resztę.
+    """
+    MatchEvent = apps.get_model('matches', 'MatchEvent')
+    max_id = MatchEvent.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    changed = 0
+    for start in range(0, max_id, BATCH_SIZE):
+        with transaction.atomic():
+            changed += canonicalize_batch(MatchEvent.objects.filter(id__gt=start, id__lte=start + BATCH_SIZE))
+    if changed:
+        print(f"\n  Przepisano {changed} starych zdarzeń do postaci kanonicznej.")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('matches', '0022_livematch_state_kickoff'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_legacy_events, migrations.RunPython.noop),
+    ]
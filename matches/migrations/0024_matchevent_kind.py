@@ -0,0 +1,22 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0023_canonical_event_types'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchevent',
+            name='kind',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(incident_type__in=('goal', 'card', 'substitution', 'period', 'injuryTime', 'varDecision'), then=models.F('incident_type')), default=models.Value('other')), output_field=models.CharField(max_length=20)),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['kind', 'incident_class'], name='matchevent_kind_class_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.11 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+BATCH_SIZE = 2000
+
+# Kopia reguł z matches.aggregates w chwili tej migracji – migracja nie może
+# zależeć od bieżącego kodu aplikacji (późniejsze zmiany liczników zmieniłyby
+# jej wynik albo ją zepsuły)
+AGGREGATE_FIELDS = ('goal_count', 'yellow_card_count', 'home_red_cards', 'away_red_cards', 'last_event_minute')
+
+_GOAL = Q(kind='goal') & ~Q(incident_class__in=('missedPenalty', 'penaltyNotAwarded'))
+_CARD = Q(kind='card', rescinded=False)
+_RED = _CARD & Q(incident_class__in=('red', 'yellowRed'))
+_TIMED = Q(kind__in=('goal', 'card', 'substitution', 'varDecision'))
+
+AGGREGATE_EXPRESSIONS = {
+    'goal_count': Count('id', filter=_GOAL),
+    'yellow_card_count': Count('id', filter=_CARD & Q(incident_class='yellow')),
+    'home_red_cards': Count('id', filter=_RED & Q(is_home_team=True)),
+    'away_red_cards': Count('id', filter=_RED & Q(is_home_team=False)),
+    'last_event_minute': Max('time', filter=_TIMED),
+}
+
+
+def backfill_aggregates(apps, schema_editor):
+    """Liczniki istniejących meczów – GROUP BY match_id paczkami meczów (bez zdarzeń zostają zera)."""
+    LiveMatch = apps.get_model('matches', 'LiveMatch')
+    MatchEvent = apps.get_model('matches', 'MatchEvent')
+    match_ids = list(
+        LiveMatch.objects.filter(events__isnull=False).order_by('id').values_list('id', flat=True).distinct()
+    )
+    for start in range(0, len(match_ids), BATCH_SIZE):
+        rows = (
+            MatchEvent.objects.filter(match_id__in=match_ids[start:start + BATCH_SIZE]).order_by()
+            .values('match_id').annotate(**AGGREGATE_EXPRESSIONS)
+        )
+        LiveMatch.objects.bulk_update(
+            [LiveMatch(id=row.pop('match_id'), **row) for row in rows], AGGREGATE_FIELDS
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0024_matchevent_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livematch',
+            name='away_red_cards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='goal_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='home_red_cards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='last_event_minute',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Minuta ostatniego gola, kartki, zmiany lub VAR', null=True),
+        ),
+        migrations.AddField(
+            model_name='livematch',
+            name='yellow_card_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
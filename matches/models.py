@@ -1,5 +1,7 @@
 from django.db import models
 
+from . import status as match_status
+
 
 class League(models.Model):
     api_id = models.CharField(max_length=100, unique=True)
@@ -23,16 +25,51 @@ class LiveMatch(models.Model):
     api_id = models.IntegerField(unique=True)
 
     league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='matches', null=True, blank=True)
-    home_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='home_matches', null=True, blank=True)
-    away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_matches', null=True, blank=True)
+    # Indeksy drużyn – złożone (drużyna, id) w Meta.indexes
+    home_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='home_matches', null=True, blank=True,
+                                  db_index=False)
+    away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_matches', null=True, blank=True,
+                                  db_index=False)
 
     country_name = models.CharField(max_length=100, blank=True, null=True)
     home_score = models.IntegerField(default=0)
     away_score = models.IntegerField(default=0)
     status = models.CharField(max_length=50)
+    state = models.CharField(max_length=20, choices=match_status.STATE_CHOICES, default=match_status.NOT_STARTED,
+                             help_text="Znormalizowany stan meczu (matches.status) – do filtrów i indeksów")
+    kickoff_at = models.DateTimeField(blank=True, null=True, db_index=True,
+                                      help_text="Planowy początek meczu (startTimestamp z API)")
     match_time = models.CharField(max_length=20, blank=True, null=True)
     home_formation = models.CharField(max_length=20, blank=True, null=True, help_text="Formacja gospodarzy, np. '4-3-3'")
     away_formation = models.CharField(max_length=20, blank=True, null=True, help_text="Formacja gości, np. '4-4-2'")
+    period_started_at = models.DateTimeField(blank=True, null=True,
+                                             help_text="Początek bieżącej połowy (z live feedu)")
+    next_poll_at = models.DateTimeField(blank=True, null=True, db_index=True,
+                                        help_text="Kiedy scheduler ma ponownie pobrać szczegóły (NULL = nigdy)")
+    sync_fingerprint = models.CharField(max_length=40, blank=True, null=True,
+                                        help_text="Skrót pól z live feedu – pozwala pominąć zapis bez zmian")
+    lineups_fingerprint = models.CharField(max_length=40, blank=True, null=True,
+                                           help_text="Skrót ostatniej odpowiedzi /lineups – pozwala pominąć odświeżenie bez zmian")
+    # Liczniki zdarzeń (matches.aggregates) – utrzymywane przez ingest szczegółów,
+    # sprawdzane komendą verify_aggregates
+    goal_count = models.PositiveSmallIntegerField(default=0)
+    yellow_card_count = models.PositiveSmallIntegerField(default=0)
+    home_red_cards = models.PositiveSmallIntegerField(default=0)
+    away_red_cards = models.PositiveSmallIntegerField(default=0)
+    last_event_minute = models.PositiveSmallIntegerField(blank=True, null=True,
+                                                         help_text="Minuta ostatniego gola, kartki, zmiany lub VAR")
+    data_version = models.PositiveIntegerField(default=0,
+                                               help_text="Podbijana przy każdej zmianie meczu, zdarzeń lub składów – "
+                                                         "klucz fragmentów w cache szablonów")
+
+    class Meta:
+        indexes = [
+            # Ostatnie mecze drużyny (matches.team): UNION dwóch zakresów po indeksie
+            models.Index(fields=['home_team', 'id'], name='livematch_home_team_id_idx'),
+            models.Index(fields=['away_team', 'id'], name='livematch_away_team_id_idx'),
+            # "Co jest teraz na żywo" – zakres po stanie, posortowany po godzinie rozpoczęcia
+            models.Index(fields=['state', 'kickoff_at'], name='livematch_state_kickoff_idx'),
+        ]
 
     def __str__(self):
         return f"{self.home_team} vs {self.away_team}"
@@ -86,59 +123,57 @@ class MatchEvent(models.Model):
     # varDecision
     confirmed = models.BooleanField(blank=True, null=True, help_text="VAR: czy decyzja potwierdzona")
 
+    # Rodzaj zdarzenia – kolumna wyliczana przez bazę z incident_type
+    # (generowana, zapisana w tabeli, z indeksem), więc "wszystkie gole"
+    # albo "czerwone kartki" to zapytania po indeksie. Stare wiersze
+    # (incidentClass w incident_type, 'Unknown' z addedTime=999) sprowadza
+    # do postaci kanonicznej migracja 0023.
+    KIND_GOAL = 'goal'
+    KIND_CARD = 'card'
+    KIND_SUBSTITUTION = 'substitution'
+    KIND_PERIOD = 'period'
+    KIND_INJURY_TIME = 'injuryTime'
+    KIND_VAR_DECISION = 'varDecision'
+    KIND_OTHER = 'other'
+    KNOWN_KINDS = (KIND_GOAL, KIND_CARD, KIND_SUBSTITUTION, KIND_PERIOD, KIND_INJURY_TIME, KIND_VAR_DECISION)
+
+    kind = models.GeneratedField(
+        expression=models.Case(
+            models.When(incident_type__in=KNOWN_KINDS, then=models.F('incident_type')),
+            default=models.Value(KIND_OTHER),
+        ),
+        output_field=models.CharField(max_length=20),
+        db_persist=True,
+    )
+
     # ========================
-    # Właściwości pomocnicze – obsługują zarówno stare dane (gdzie incidentClass
-    # był zapisywany jako incident_type), jak i nowe dane (poprawne incidentType)
+    # Właściwości pomocnicze
     # ========================
 
-    # --- Stałe rozpoznawania typów ---
-    _GOAL_TYPES = {'goal', 'regular', 'penalty', 'ownGoal', 'penaltyNotAwarded', 'missedPenalty'}
-    _CARD_TYPES = {'card', 'yellow', 'yellowRed', 'red'}
-    _SUB_TYPES = {'substitution'}
-    _PERIOD_TYPES = {'period', 'Unknown'}  # Old data stores periods as 'Unknown'
-    _INJURY_TIME_TYPES = {'injuryTime'}
-
     @property
     def is_goal(self):
-        """Czy to gol? Obsługuje stare dane (regular/penalty/ownGoal) i nowe (goal)."""
-        if self.incident_type == 'goal':
-            return True
-        # Stare dane: incident_type = incidentClass
-        if self.incident_type in ('regular', 'penalty', 'ownGoal'):
-            # Upewnij się, że to nie jest inny typ zdarzenia
-            return bool(self.player_name and self.player_name != 'Nieznany')
-        return False
+        return self.kind == self.KIND_GOAL
 
     @property
     def is_card(self):
-        """Czy to kartka?"""
-        if self.incident_type == 'card':
-            return True
-        # Stare dane: incident_type = 'yellow' / 'red' / 'yellowRed'
-        return self.incident_type in ('yellow', 'yellowRed', 'red')
+        return self.kind == self.KIND_CARD
 
     @property
     def is_substitution(self):
-        """Czy to zmiana?"""
-        return self.incident_type == 'substitution'
+        return self.kind == self.KIND_SUBSTITUTION
 
     @property
     def is_period_marker(self):
         """Czy to marker okresu (HT/FT)?"""
-        if self.incident_type == 'period':
-            return True
-        # Stare dane: 'Unknown' z addedTime=999 i player='Nieznany'
-        if self.incident_type == 'Unknown' and self.added_time and self.added_time >= 900:
-            return True
-        return False
+        return self.kind == self.KIND_PERIOD
 
     @property
     def is_injury_time_announcement(self):
-        return self.incident_type == 'injuryTime'
+        return self.kind == self.KIND_INJURY_TIME
 
     @property
     def is_var_decision(self):
-        return self.incident_type == 'varDecision'
+        return self.kind == self.KIND_VAR_DECISION
 
     @property
     def formatted_time(self):
@@ -154,23 +189,24 @@ class MatchEvent(models.Model):
             return f"{self.home_score} - {self.away_score}"
         return ""
 
+    _CLASS_LABELS = {
+        'ownGoal': 'samobój',
+        'penalty': 'karny',
+        'missedPenalty': 'niestrzelony karny',
+        'penaltyNotAwarded': 'karny nie uznany',
+        'yellowRed': '2× żółta',
+    }
+
+    _CARD_COLORS = {
+        'yellow': 'yellow',
+        'yellowRed': 'yellow-red',
+        'red': 'red',
+    }
+
     @property
     def incident_class_label(self):
-        """Zwraca czytelną etykietę dla incidentClass (lub dla starego incident_type)."""
-        # Sprawdź incident_class (nowe dane)
-        ic = self.incident_class
-        # Jeśli brak, użyj incident_type (stare dane)
-        if not ic and self.is_goal:
-            ic = self.incident_type
-
-        labels = {
-            'ownGoal': 'samobój',
-            'penalty': 'karny',
-            'missedPenalty': 'niestrzelony karny',
-            'penaltyNotAwarded': 'karny nie uznany',
-            'yellowRed': '2× żółta',
-        }
-        return labels.get(ic, '')
+        """Czytelna etykieta incidentClass."""
+        return self._CLASS_LABELS.get(self.incident_class, '')
 
     @property
     def side(self):
@@ -180,23 +216,14 @@ class MatchEvent(models.Model):
 
     @property
     def card_color(self):
-        """Kolor kartki – obsługa starego i nowego formatu."""
+        """Kolor kartki (z incident_class), domyślnie żółta."""
         if not self.is_card:
             return None
-        # Nowe dane: incident_type='card', kolor w incident_class
-        color_source = self.incident_class or self.incident_type
-        mapping = {
-            'yellow': 'yellow',
-            'yellowRed': 'yellow-red',
-            'red': 'red',
-            'card': 'yellow',  # fallback
-        }
-        return mapping.get(color_source, 'yellow')
+        return self._CARD_COLORS.get(self.incident_class, 'yellow')
 
     @property
     def display_player_in(self):
-        """Gracz wchodzący – fallback na player_name dla starych danych."""
-        return self.player_in_name or self.player_name or ''
+        return self.player_in_name or ''
 
     @property
     def display_player_out(self):
@@ -205,12 +232,24 @@ class MatchEvent(models.Model):
 
     class Meta:
         ordering = ['time', 'added_time', 'id']
+        constraints = [
+            # Jedno zdarzenie API na mecz – podstawa upsertu w sync_match_incidents
+            models.UniqueConstraint(
+                fields=['match', 'event_id'],
+                condition=models.Q(event_id__isnull=False) & ~models.Q(event_id=''),
+                name='unique_match_event_id',
+            ),
+        ]
+        indexes = [
+            # "Wszystkie gole", "czerwone kartki" (kind='card', incident_class='red')
+            models.Index(fields=['kind', 'incident_class'], name='matchevent_kind_class_idx'),
+        ]
 
 
 class MatchLineup(models.Model):
     match = models.ForeignKey(LiveMatch, on_delete=models.CASCADE, related_name='lineups')
     player_name = models.CharField(max_length=100)
-    player_api_id = models.IntegerField(blank=True, null=True)
+    player_api_id = models.IntegerField(blank=True, null=True, db_index=True)
     shirt_number = models.IntegerField(blank=True, null=True)
     position = models.CharField(max_length=50, blank=True, null=True)
     is_home_team = models.BooleanField(default=True)
@@ -253,7 +292,79 @@ class MissingPlayer(models.Model):
     
     is_home_team = models.BooleanField(default=True)
 
+    class Meta:
+        unique_together = ('match', 'player_name', 'is_home_team')
+
     def __str__(self):
         team = "Home" if self.is_home_team else "Away"
         status = "Missing" if self.type == 'missing' else "Doubtful"
         return f"{self.player_name} ({team}) - {status}"
+
+
+class MatchDetailSnapshot(models.Model):
+    """Gotowy dokument strony meczu (matches.detail), przebudowywany przez ingest."""
+    match = models.OneToOneField(LiveMatch, on_delete=models.CASCADE, primary_key=True,
+                                 related_name='detail_snapshot')
+    version = models.PositiveSmallIntegerField(help_text="Wersja formatu dokumentu")
+    data = models.JSONField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot: {self.match}"
+
+
+class SearchTerm(models.Model):
+    """
+    Indeks wyszukiwarki (matches.search): nazwa drużyny, ligi lub gracza
+    sprowadzona do ASCII, małych liter i pojedynczych spacji – jeden wiersz
+    na każdy początek słowa ("real madrid", "madrid"). Wyszukiwanie to zakres
+    po indeksie na term, bez LIKE '%q%'.
+    """
+    KIND_TEAM = 'team'
+    KIND_LEAGUE = 'league'
+    KIND_PLAYER = 'player'
+    KIND_CHOICES = [
+        (KIND_TEAM, 'Drużyna'),
+        (KIND_LEAGUE, 'Liga'),
+        (KIND_PLAYER, 'Gracz'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.IntegerField(help_text="ID drużyny/ligi, dla gracza – player_api_id")
+    position = models.PositiveSmallIntegerField(help_text="Numer słowa, od którego zaczyna się term (0 = cała nazwa)")
+    term = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, help_text="Nazwa do wyświetlenia")
+    url = models.CharField(max_length=255, blank=True, null=True)
+    logo_url = models.URLField(blank=True, null=True)
+    popularity = models.PositiveIntegerField(default=0, help_text="Liczba meczów (gracz: występów) – ranking wyników")
+
+    class Meta:
+        unique_together = ('kind', 'object_id', 'position')
+        indexes = [
+            # Obejmujący: wyszukiwanie i sortowanie kandydatów bez odczytu tabeli
+            models.Index(fields=['kind', 'term', 'position', 'popularity'], name='search_kind_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.term}"
+
+
+class ApiUsage(models.Model):
+    """Licznik zapytań do API per endpoint i okres (dzień / miesiąc)."""
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'Dzień'),
+        (PERIOD_MONTH, 'Miesiąc'),
+    ]
+
+    endpoint = models.CharField(max_length=50)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('endpoint', 'period', 'period_start')
+
+    def __str__(self):
+        return f"{self.endpoint} [{self.period} {self.period_start}]: {self.count}"
@@ -0,0 +1,169 @@
+"""
+Adaptacyjny harmonogram odpytywania API.
+
+Zamiast pobierać cały live feed co 5 minut, beat wywołuje co minutę
+run_tick(), który:
+  1. pobiera live feed tylko wtedy, gdy minął jego termin – puste okna
+     (brak meczów na żywo) wydłużają odstęp wykładniczo,
+  2. oznacza mecze zmienione przez feed (i zamknięte, bo z niego
+     zniknęły) jako "do pobrania teraz",
+  3. pobiera szczegóły wyłącznie meczów, którym minął next_poll_at,
+     i wylicza im kolejny termin na podstawie statusu.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import budget, status as match_status
+from .fetcher import DETAIL_ENDPOINTS
+from .models import LiveMatch
+from .services import ingest_many_match_details, sync_live_matches
+
+FEED_STATE_KEY = 'scheduler:feed'
+
+# Odstępy w sekundach; None = nie odpytujemy więcej
+DEFAULT_POLL_INTERVALS = {
+    'in_play': 120,
+    'in_play_closing': 60,  # końcówka połowy – tu padają bramki i kartki
+    'half_time': 300,
+    'not_started': 900,
+    'finished': None,
+}
+
+DEFAULT_FEED_INTERVAL = 60
+DEFAULT_FEED_MAX_INTERVAL = 1800
+# Od której minuty połowy mecz jest w "końcówce"
+DEFAULT_CLOSING_MINUTE = 40
+DEFAULT_MAX_DETAILS_PER_TICK = 50
+
+# Stan meczu (LiveMatch.state) → klucz odstępu w SCHEDULER_POLL_INTERVALS
+_POLL_STATES = {
+    match_status.NOT_STARTED: 'not_started',
+    match_status.IN_PLAY: 'in_play',
+    match_status.HALF_TIME: 'half_time',
+    match_status.INTERRUPTED: 'half_time',
+    match_status.FINISHED: 'finished',
+    match_status.POSTPONED: 'finished',
+    match_status.CANCELLED: 'finished',
+}
+
+
+def classify_status(match):
+    """Stan meczu → 'not_started' / 'in_play' / 'half_time' / 'finished'."""
+    return _POLL_STATES.get(match.state, 'not_started')
+
+
+def _intervals():
+    return {**DEFAULT_POLL_INTERVALS, **getattr(settings, 'SCHEDULER_POLL_INTERVALS', {})}
+
+
+def match_priority(match):
+    """Priorytet pobrania w budżecie API: mecze na żywo w topowych ligach najpierw."""
+    state = classify_status(match)
+    if state in ('in_play', 'half_time'):
+        top_leagues = {str(api_id) for api_id in getattr(settings, 'TOP_LEAGUE_IDS', ())}
+        if match.league_id and match.league.api_id in top_leagues:
+            return budget.PRIORITY_LIVE_TOP
+        return budget.PRIORITY_LIVE
+    if state == 'not_started':
+        return budget.PRIORITY_SCHEDULED
+    return budget.PRIORITY_BACKFILL
+
+
+def next_poll_time(match, now):
+    """Kolejny termin pobrania szczegółów meczu albo None (mecz zakończony lub zawieszony)."""
+    intervals = _intervals()
+    state = classify_status(match)
+    if match_status.is_stale(match, now):
+        return None
+
+    if state == 'in_play':
+        closing_minute = getattr(settings, 'SCHEDULER_CLOSING_MINUTE', DEFAULT_CLOSING_MINUTE)
+        if match.period_started_at and now - match.period_started_at >= timedelta(minutes=closing_minute):
+            state = 'in_play_closing'
+
+    seconds = intervals.get(state)
+    if seconds is None:
+        return None
+    return now + timedelta(seconds=seconds)
+
+
+def _feed_due(now):
+    state = cache.get(FEED_STATE_KEY)
+    return state is None or state['next_at'] <= now
+
+
+def _schedule_feed(now, events_count):
+    """Pusty feed → odstęp rośnie x2 aż do limitu; mecze na żywo → odstęp bazowy."""
+    base = getattr(settings, 'SCHEDULER_FEED_INTERVAL', DEFAULT_FEED_INTERVAL)
+    limit = getattr(settings, 'SCHEDULER_FEED_MAX_INTERVAL', DEFAULT_FEED_MAX_INTERVAL)
+    state = cache.get(FEED_STATE_KEY) or {'empty_streak': 0}
+
+    empty_streak = state['empty_streak'] + 1 if events_count == 0 else 0
+    interval = min(limit, base * (2 ** empty_streak))
+    cache.set(FEED_STATE_KEY, {
+        'next_at': now + timedelta(seconds=interval),
+        'empty_streak': empty_streak,
+    }, timeout=None)
+    return interval
+
+
+def run_tick(now=None, ingest=None):
+    """
+    Jeden krok harmonogramu. Zwraca słownik z podsumowaniem.
+    ingest: funkcja przyjmująca listę meczów do pobrania – domyślnie
+    ingest_many_match_details w tym procesie; task Celery przekazuje
+    rozproszenie na subtaski (tasks.dispatch_detail_ingest).
+    """
+    now = now or timezone.now()
+    ingest = ingest or ingest_many_match_details
+    summary = {'feed_polled': False, 'details_polled': 0, 'finished': 0, 'shed': 0, 'stale': 0}
+
+    # 1. Live feed – tylko gdy minął jego termin (i jest na niego budżet)
+    if _feed_due(now):
+        admitted, _ = budget.admit([(budget.PRIORITY_LIVE_TOP, 'feed')])
+        if not admitted:
+            summary['feed_interval'] = _schedule_feed(now, 0)
+            print("Budżet API wyczerpany – pomijam live feed.")
+            return summary
+
+        stats = sync_live_matches()
+        summary['feed_polled'] = True
+        summary['feed_interval'] = _schedule_feed(now, stats['events'])
+        # Zamknięte mecze – jeszcze jedno pobranie szczegółów (końcowe zdarzenia),
+        # potem next_poll_time zwraca dla nich None
+        refresh_ids = stats['changed_api_ids'] + stats['closed_api_ids']
+        if refresh_ids:
+            LiveMatch.objects.filter(api_id__in=refresh_ids).update(next_poll_at=now)
+
+    # 2. Szczegóły meczów, którym minął termin – bez zawieszonych
+    summary['stale'] = (
+        LiveMatch.objects.filter(match_status.stale_q(now), next_poll_at__isnull=False)
+        .update(next_poll_at=None)
+    )
+    limit = getattr(settings, 'SCHEDULER_MAX_DETAILS_PER_TICK', DEFAULT_MAX_DETAILS_PER_TICK)
+    due = list(
+        LiveMatch.objects.filter(next_poll_at__lte=now)
+        .select_related('league', 'home_team', 'away_team')
+        .order_by('next_poll_at')[:limit]
+    )
+    if not due:
+        return summary
+
+    # Kolejka priorytetowa – przy niskim budżecie odpadają mniej ważne mecze
+    admitted, shed = budget.admit(((match_priority(m), m) for m in due), cost=len(DETAIL_ENDPOINTS))
+    if admitted:
+        ingest(admitted)
+    summary['details_polled'] = len(admitted)
+    summary['shed'] = len(shed)
+
+    # 3. Nowe terminy (także dla odrzuconych – spróbujemy w kolejnym oknie)
+    for match in due:
+        match.next_poll_at = next_poll_time(match, now)
+        if match.next_poll_at is None and match not in shed:
+            summary['finished'] += 1
+    LiveMatch.objects.bulk_update(due, ['next_poll_at'])
+
+    return summary
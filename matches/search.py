@@ -0,0 +1,371 @@
+"""
+Wyszukiwarka drużyn, lig i graczy (autocomplete w base.html).
+
+- fold(): nazwa → ASCII, małe litery, pojedyncze spacje ("Górnik Łęczna" →
+  "gornik leczna"), więc "Gornik" znajduje "Górnik".
+- Indeks SearchTerm: jeden wiersz na każdy początek słowa nazwy, zapytanie
+  to zakres term >= q AND term < q + U+10FFFF po indeksie obejmującym
+  (bez LIKE '%q%'); dane do wyświetlenia czytamy tylko dla najlepszych.
+- Ranking: najpierw dopasowanie początku nazwy, potem początku dalszego
+  słowa; w obrębie – popularność (liczba meczów / występów).
+- Synchronizacja: sygnały post_save/post_delete Team i League (admin) oraz
+  jawne wywołania index_* przy wsadowym imporcie (bulk_create nie wysyła
+  sygnałów). Obiekty bez zmian nazwy są pomijane – jeden SELECT na paczkę.
+- Sync live feedu indeksuje tylko nowe drużyny i ligi oraz ligi ze zmienioną
+  nazwą; popularność odświeża okresowa przebudowa (rebuild_index).
+- Gorące zapytania: cache LRU w pamięci procesu (SEARCH_HOT_CACHE_SIZE
+  wpisów, SEARCH_HOT_CACHE_TTL sekund). Klucz zawiera wersję indeksu ze
+  wspólnego cache – zmiana indeksu w dowolnym procesie (np. worker Celery)
+  unieważnia wpisy także w procesach web.
+"""
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+
+from .models import League, LiveMatch, MatchLineup, SearchTerm, Team
+
+KINDS = (SearchTerm.KIND_TEAM, SearchTerm.KIND_LEAGUE, SearchTerm.KIND_PLAYER)
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+DEFAULT_HOT_CACHE_SIZE = 1024
+DEFAULT_HOT_CACHE_TTL = 30
+
+INDEX_VERSION_KEY = 'search:index:version'
+
+# Ile słów nazwy indeksujemy jako osobne początki ("FC Bayern München II")
+MAX_TERM_WORDS = 6
+# Rozmiar paczki przy przebudowie całego indeksu
+REBUILD_CHUNK_SIZE = 2000
+
+# Górna granica zakresu dla zapytania prefiksowego
+_MAX_CHAR = '\U0010ffff'
+
+# Litery, których NFKD nie rozkłada na literę bazową + znak diakrytyczny
+_EXTRA_FOLDS = str.maketrans({
+    'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ø': 'o', 'Ø': 'O', 'ı': 'i',
+    'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'þ': 'th', 'Þ': 'TH',
+})
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def fold(text):
+    """Nazwa → postać do wyszukiwania: bez diakrytyków, małe litery, słowa oddzielone spacją."""
+    text = unicodedata.normalize('NFKD', (text or '').translate(_EXTRA_FOLDS))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(word for word in _SEPARATORS.split(text.lower()) if word)
+
+
+def terms_for(name):
+    """Początki słów nazwy: "real madrid" → ["real madrid", "madrid"]."""
+    words = fold(name).split()
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_TERM_WORDS))]
+
+
+# =============================================================================
+#  Cache gorących zapytań (w pamięci procesu)
+# =============================================================================
+
+_hot_cache = OrderedDict()
+_hot_lock = threading.Lock()
+
+
+def _hot_get(key):
+    with _hot_lock:
+        entry = _hot_cache.get(key)
+        if entry is None:
+            return None
+        results, expires_at = entry
+        if expires_at < time.monotonic():
+            del _hot_cache[key]
+            return None
+        _hot_cache.move_to_end(key)
+        return results
+
+
+def _hot_set(key, results):
+    size = getattr(settings, 'SEARCH_HOT_CACHE_SIZE', DEFAULT_HOT_CACHE_SIZE)
+    ttl = getattr(settings, 'SEARCH_HOT_CACHE_TTL', DEFAULT_HOT_CACHE_TTL)
+    if not size:
+        return
+    with _hot_lock:
+        _hot_cache[key] = (results, time.monotonic() + ttl)
+        _hot_cache.move_to_end(key)
+        while len(_hot_cache) > size:
+            _hot_cache.popitem(last=False)
+
+
+def clear_hot_cache():
+    with _hot_lock:
+        _hot_cache.clear()
+
+
+def index_version():
+    return cache.get_or_set(INDEX_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def _index_changed():
+    """Nowa wersja indeksu (wspólny cache) – gorące wpisy wszystkich procesów przestają pasować."""
+    cache.set(INDEX_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    clear_hot_cache()
+
+
+# =============================================================================
+#  Wyszukiwanie
+# =============================================================================
+
+def search(query, kinds=KINDS, limit=None, use_cache=True):
+    """
+    Wyniki [{'type', 'id', 'name', 'url', 'logo_url'}] dla zapytania
+    (prefiks nazwy lub dowolnego jej słowa), najlepsze pierwsze.
+    """
+    limit = limit or getattr(settings, 'SEARCH_RESULTS_LIMIT', DEFAULT_LIMIT)
+    q = fold(query)
+    if len(q) < MIN_QUERY_LENGTH:
+        return []
+
+    if use_cache:
+        key = (index_version(), q, tuple(kinds), limit)
+        cached = _hot_get(key)
+        if cached is not None:
+            return cached
+
+    # 1. Kandydaci z samego indeksu (kind, term, position, popularity) – bez
+    #    odczytu tabeli; ta sama nazwa może pasować kilkoma słowami, więc z zapasem
+    candidates = list(
+        SearchTerm.objects
+        .filter(kind__in=kinds, term__gte=q, term__lt=q + _MAX_CHAR)
+        .order_by('position', '-popularity', 'id')
+        .values_list('id', flat=True)[:limit * 3]
+    )
+    # 2. Dane do wyświetlenia tylko dla kandydatów
+    rows = SearchTerm.objects.filter(id__in=candidates).values_list(
+        'id', 'kind', 'object_id', 'name', 'url', 'logo_url'
+    )
+    by_id = {row[0]: row[1:] for row in rows}
+
+    results = []
+    seen = set()
+    for candidate in candidates:
+        kind, object_id, name, url, logo_url = by_id[candidate]
+        if (kind, object_id) in seen:
+            continue
+        seen.add((kind, object_id))
+        results.append({'type': kind, 'id': object_id, 'name': name, 'url': url, 'logo_url': logo_url or ''})
+        if len(results) == limit:
+            break
+
+    if use_cache:
+        _hot_set(key, results)
+    return results
+
+
+# =============================================================================
+#  Indeksowanie
+# =============================================================================
+
+def _index_documents(kind, docs):
+    """
+    docs: {object_id: {'name', 'url', 'logo_url', 'popularity'}}. Przebudowuje
+    wpisy obiektów, których nazwa, link lub logo się zmieniły (popularność
+    None = zachowaj dotychczasową). Zwraca liczbę przeindeksowanych obiektów.
+    """
+    if not docs:
+        return 0
+
+    current = {}
+    for object_id, name, url, logo_url, popularity in (
+        SearchTerm.objects.filter(kind=kind, object_id__in=list(docs), position=0)
+        .values_list('object_id', 'name', 'url', 'logo_url', 'popularity')
+    ):
+        current[object_id] = (name, url, logo_url, popularity)
+
+    changed = {}
+    for object_id, doc in docs.items():
+        known = current.get(object_id)
+        popularity = doc.get('popularity')
+        if popularity is None:
+            popularity = known[3] if known else 0
+        if known and known == (doc['name'], doc['url'], doc['logo_url'], popularity):
+            continue
+        changed[object_id] = dict(doc, popularity=popularity)
+
+    if not changed:
+        return 0
+
+    rows = [
+        SearchTerm(
+            kind=kind, object_id=object_id, position=position, term=term,
+            name=doc['name'], url=doc['url'], logo_url=doc['logo_url'], popularity=doc['popularity'],
+        )
+        for object_id, doc in changed.items()
+        for position, term in enumerate(terms_for(doc['name']))
+    ]
+    with transaction.atomic():
+        SearchTerm.objects.filter(kind=kind, object_id__in=list(changed)).delete()
+        SearchTerm.objects.bulk_create(rows)
+
+    _index_changed()
+    return len(changed)
+
+
+def _match_counts(field, ids):
+    """Liczba meczów per drużyna/liga – jedno zapytanie z GROUP BY na pole."""
+    counts = {}
+    for value, total in (
+        LiveMatch.objects.filter(**{f'{field}__in': ids}).order_by()
+        .values_list(field).annotate(total=Count('id'))
+    ):
+        counts[value] = counts.get(value, 0) + total
+    return counts
+
+
+def index_teams(teams, with_popularity=True):
+    """Indeksuje drużyny (instancje Team). Zwraca liczbę przeindeksowanych."""
+    teams = list(teams)
+    ids = [team.id for team in teams]
+    popularity = {}
+    if with_popularity and ids:
+        popularity = _match_counts('home_team', ids)
+        for team_id, total in _match_counts('away_team', ids).items():
+            popularity[team_id] = popularity.get(team_id, 0) + total
+
+    return _index_documents(SearchTerm.KIND_TEAM, {
+        team.id: {
+            'name': team.name,
+            'url': reverse('team_detail', args=[team.id]),
+            'logo_url': team.logo_url,
+            'popularity': popularity.get(team.id, 0) if with_popularity else None,
+        }
+        for team in teams
+    })
+
+
+def index_leagues(leagues, with_popularity=True):
+    """Indeksuje ligi (link: strona główna z filtrem ligi)."""
+    leagues = list(leagues)
+    popularity = _match_counts('league', [league.id for league in leagues]) if with_popularity and leagues else {}
+
+    return _index_documents(SearchTerm.KIND_LEAGUE, {
+        league.id: {
+            'name': league.name,
+            'url': f"{reverse('home')}?{urlencode({'league': league.name})}",
+            'logo_url': None,
+            'popularity': popularity.get(league.id, 0) if with_popularity else None,
+        }
+        for league in leagues
+    })
+
+
+def index_players(player_ids, with_popularity=True):
+    """
+    Indeksuje graczy po player_api_id na podstawie ich składów: nazwa i link
+    do drużyny z najnowszego meczu, popularność = liczba występów.
+    """
+    player_ids = [player_id for player_id in set(player_ids) if player_id is not None]
+    if not player_ids:
+        return 0
+
+    latest = {}
+    for player_id, name, is_home, home_team_id, away_team_id in (
+        MatchLineup.objects.filter(player_api_id__in=player_ids)
+        .order_by('player_api_id', '-match_id')
+        .values_list('player_api_id', 'player_name', 'is_home_team', 'match__home_team', 'match__away_team')
+    ):
+        # Pierwszy wiersz gracza = najnowszy mecz
+        if player_id not in latest:
+            latest[player_id] = (name, home_team_id if is_home else away_team_id)
+
+    popularity = {}
+    if with_popularity:
+        popularity = dict(
+            MatchLineup.objects.filter(player_api_id__in=player_ids).order_by()
+            .values_list('player_api_id').annotate(total=Count('id'))
+        )
+
+    return _index_documents(SearchTerm.KIND_PLAYER, {
+        player_id: {
+            'name': name,
+            'url': reverse('team_detail', args=[team_id]) if team_id else None,
+            'logo_url': None,
+            'popularity': popularity.get(player_id, 0) if with_popularity else None,
+        }
+        for player_id, (name, team_id) in latest.items()
+    })
+
+
+def remove_from_index(kind, object_id):
+    SearchTerm.objects.filter(kind=kind, object_id=object_id).delete()
+    _index_changed()
+
+
+def rebuild_index(chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Przebudowa całego indeksu z aktualną popularnością (paczkami po
+    chunk_size obiektów) i usunięcie wpisów po obiektach, których już nie ma.
+    Zwraca słownik {'teams', 'leagues', 'players', 'removed'}.
+    """
+    stats = {'teams': 0, 'leagues': 0, 'players': 0, 'removed': 0}
+
+    def chunks(queryset):
+        batch = []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) == chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    for batch in chunks(Team.objects.order_by('id')):
+        stats['teams'] += index_teams(batch)
+    for batch in chunks(League.objects.order_by('id')):
+        stats['leagues'] += index_leagues(batch)
+    for batch in chunks(
+        MatchLineup.objects.filter(player_api_id__isnull=False).order_by('player_api_id')
+        .values_list('player_api_id', flat=True).distinct()
+    ):
+        stats['players'] += index_players(batch)
+
+    for kind, model in ((SearchTerm.KIND_TEAM, Team), (SearchTerm.KIND_LEAGUE, League)):
+        stale = SearchTerm.objects.filter(kind=kind).exclude(object_id__in=model.objects.values('id'))
+        stats['removed'] += stale.delete()[0]
+    stale = SearchTerm.objects.filter(kind=SearchTerm.KIND_PLAYER).exclude(
+        object_id__in=MatchLineup.objects.filter(player_api_id__isnull=False).values('player_api_id')
+    )
+    stats['removed'] += stale.delete()[0]
+
+    _index_changed()
+    return stats
+
+
+# =============================================================================
+#  Sygnały (zapis pojedynczego obiektu, np. w adminie)
+# =============================================================================
+
+def on_team_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_teams([instance], with_popularity=False)
+
+
+def on_league_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_leagues([instance], with_popularity=False)
+
+
+def on_team_deleted(sender, instance, **kwargs):
+    remove_from_index(SearchTerm.KIND_TEAM, instance.id)
+
+
+def on_league_deleted(sender, instance, **kwargs):
+    remove_from_index(SearchTerm.KIND_LEAGUE, instance.id)
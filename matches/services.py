@@ -1,100 +1,297 @@
-import os
-import requests
+import hashlib
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F
 from dotenv import load_dotenv
-from .models import LiveMatch, Team, League, MatchEvent, MatchLineup, MissingPlayer
+from . import archive, budget, search
+from .client import get_client
+from .aggregates import refresh_match_aggregates
+from .detail import rebuild_detail_snapshot
+from .home import bump_home_version
+from .team import bump_team_versions
+from .fetcher import DETAIL_ENDPOINTS, fetch_many_details
+from .status import FINISHED, LIVE_STATES, normalize_status
+from .models import LiveMatch, Team, League, MatchDetailSnapshot, MatchEvent, MatchLineup, MissingPlayer
 
 # Ładujemy klucze z pliku .env
 load_dotenv()
 
 
+def _flush_usage():
+    """Zapisuje liczniki budżetu API; błąd zapisu nie przerywa synchronizacji."""
+    try:
+        budget.flush()
+    except Exception as e:
+        print(f"Błąd zapisu liczników budżetu API: {e}")
+
+
 def fetch_live_matches():
     """KROK 1: Pobiera listę meczów na żywo"""
-    url = "https://sportapi7.p.rapidapi.com/api/v1/sport/football/events/live"
+    response = get_client().live_matches()
+    _flush_usage()
+    if response is None:
+        return None
+    return response.data
+
 
-    headers = {
-        "x-rapidapi-key": os.getenv("SPORT_API_KEY"),
-        "x-rapidapi-host": os.getenv("SPORT_API_HOST")
+def _parse_live_event(event):
+    """Wyciąga z eventu live-feedu tylko pola potrzebne do zapisu (rzuca KeyError przy braku danych)."""
+    league_data = event['tournament']
+    category = league_data.get('category', {})
+    home_data = event['homeTeam']
+    away_data = event['awayTeam']
+
+    return {
+        'api_id': event['id'],
+        'league': {
+            'api_id': str(league_data['id']),
+            'name': league_data['name'],
+            'country': category.get('name', 'Inne'),
+        },
+        'home_team': {'api_id': home_data['id'], 'name': home_data['name']},
+        'away_team': {'api_id': away_data['id'], 'name': away_data['name']},
+        'home_score': event['homeScore'].get('current', 0),
+        'away_score': event['awayScore'].get('current', 0),
+        'status': event['status']['description'],
+        'state': normalize_status(event['status']),
+        'kickoff_at': event.get('startTimestamp'),
+        'period_started_at': (event.get('time') or {}).get('currentPeriodStartTimestamp'),
     }
 
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        print(f"Błąd API (Live Matches): {response.status_code}")
-        return None
-    except Exception as e:
-        print(f"Błąd połączenia: {e}")
+
+def _from_timestamp(value):
+    """Unix timestamp z API → aware datetime (UTC) albo None."""
+    if not value:
         return None
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def _fingerprint(row):
+    """Stabilny skrót znormalizowanych pól meczu z live feedu."""
+    raw = json.dumps(row, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _bulk_upsert_leagues(rows, stats):
+    """
+    Jedno zapytanie IN + bulk_create/bulk_update. Zwraca ({api_id: League},
+    api_id lig nowych lub ze zmienioną nazwą – do indeksu wyszukiwarki).
+    """
+    wanted = {}
+    for row in rows:
+        data = row['league']
+        current = wanted.get(data['api_id'])
+        if current is None:
+            wanted[data['api_id']] = dict(data)
+        else:
+            # Jak przy get_or_create w pętli: nazwa – ostatnia wygrywa, kraj – pierwszy niepusty
+            current['name'] = data['name']
+            if not current['country'] and data['country']:
+                current['country'] = data['country']
+
+    existing = League.objects.in_bulk(list(wanted), field_name='api_id')
+
+    to_create, to_update = [], []
+    renamed = []
+    for api_id, data in wanted.items():
+        league = existing.get(api_id)
+        if league is None:
+            to_create.append(League(api_id=api_id, name=data['name'], country=data['country']))
+            continue
+
+        updated = False
+        if not league.country and data['country']:
+            league.country = data['country']
+            updated = True
+        if league.name != data['name']:
+            league.name = data['name']
+            renamed.append(api_id)
+            updated = True
+        if updated:
+            to_update.append(league)
+
+    if to_create:
+        League.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        League.objects.bulk_update(to_update, ['name', 'country'])
+
+    stats['leagues_created'] = len(to_create)
+    stats['leagues_updated'] = len(to_update)
+
+    if to_create:
+        existing = League.objects.in_bulk(list(wanted), field_name='api_id')
+    return existing, [league.api_id for league in to_create] + renamed
+
+
+def _bulk_get_or_create_teams(rows, stats):
+    """
+    Odpowiednik Team.get_or_create dla całego feedu. Zwraca ({api_id: Team},
+    api_id utworzonych drużyn).
+    """
+    wanted = {}
+    for row in rows:
+        for side in ('home_team', 'away_team'):
+            data = row[side]
+            wanted.setdefault(data['api_id'], data['name'])
+
+    existing = Team.objects.in_bulk(list(wanted), field_name='api_id')
+
+    to_create = [
+        Team(api_id=api_id, name=name)
+        for api_id, name in wanted.items()
+        if api_id not in existing
+    ]
+    if to_create:
+        Team.objects.bulk_create(to_create, ignore_conflicts=True)
+        existing = Team.objects.in_bulk(list(wanted), field_name='api_id')
+
+    stats['teams_created'] = len(to_create)
+    return existing, [team.api_id for team in to_create]
+
+
+def _close_dropped_matches(feed_api_ids, stats):
+    """
+    Mecze "na żywo", których nie ma już w live feedzie, skończyły się –
+    oznaczamy je jako zakończone (jedno UPDATE). Odcisk jest czyszczony,
+    więc gdy mecz wróci do feedu (chwilowy brak), kolejny sync nadpisze stan.
+    """
+    dropped = list(
+        LiveMatch.objects.filter(state__in=LIVE_STATES).exclude(api_id__in=feed_api_ids)
+        .values_list('api_id', 'home_team_id', 'away_team_id')
+    )
+    if not dropped:
+        return
+
+    api_ids = [api_id for api_id, _, _ in dropped]
+    LiveMatch.objects.filter(api_id__in=api_ids).update(
+        state=FINISHED, status='Ended', sync_fingerprint='', data_version=F('data_version') + 1,
+    )
+    stats['closed_api_ids'] = api_ids
+    bump_home_version()
+    bump_team_versions([home for _, home, _ in dropped] + [away for _, _, away in dropped])
 
 
 def sync_live_matches():
-    """KROK 2: Zapisuje mecze do bazy (bez zmian w logice)"""
+    """
+    KROK 2: Zapisuje mecze do bazy – wsadowo.
+    Mecze, których odcisk (sync_fingerprint) się nie zmienił, są pomijane
+    bez żadnego zapisu. Dla pozostałych: ligi i drużyny – jedno zapytanie IN
+    + bulk_create brakujących, mecze – jeden bulk_create(update_conflicts=True).
+    Mecze na żywo, które zniknęły z feedu, są zamykane (stan "zakończony").
+    Zwraca słownik z licznikami dla każdego etapu oraz 'changed_api_ids'
+    (mecze faktycznie zapisane – tylko je trzeba odświeżać dalej)
+    i 'closed_api_ids' (mecze zamknięte).
+    """
+    stats = {
+        'events': 0,
+        'skipped': 0,
+        'unchanged': 0,
+        'leagues_created': 0,
+        'leagues_updated': 0,
+        'teams_created': 0,
+        'matches_upserted': 0,
+        'changed_api_ids': [],
+        'closed_api_ids': [],
+    }
+
     data = fetch_live_matches()
 
     if not data or 'events' not in data:
         print("Brak danych do zsynchronizowania.")
-        return
+        return stats
 
-    count = 0
+    # 1. Parsowanie – błędne eventy pomijamy, jak dotychczas
+    rows = {}
     for event in data['events']:
+        stats['events'] += 1
         try:
-            # 1. Liga + Kraj z tournament.category
-            league_data = event['tournament']
-            category = league_data.get('category', {})
-            country_name = category.get('name', 'Inne')
-            country_alpha2 = category.get('alpha2', '')
-
-            league, created = League.objects.get_or_create(
-                api_id=league_data['id'],
-                defaults={
-                    'name': league_data['name'],
-                    'country': country_name,
-                }
-            )
-            # Aktualizuj kraj i nazwę jeśli liga już istnieje
-            if not created:
-                updated = False
-                if not league.country and country_name:
-                    league.country = country_name
-                    updated = True
-                if league.name != league_data['name']:
-                    league.name = league_data['name']
-                    updated = True
-                if updated:
-                    league.save()
-
-            # 2. Drużyny
-            home_data = event['homeTeam']
-            away_data = event['awayTeam']
-
-            home_team, _ = Team.objects.get_or_create(
-                api_id=home_data['id'],
-                defaults={'name': home_data['name']}
-            )
-            away_team, _ = Team.objects.get_or_create(
-                api_id=away_data['id'],
-                defaults={'name': away_data['name']}
-            )
-
-            # 3. Mecz
-            LiveMatch.objects.update_or_create(
-                api_id=event['id'],
-                defaults={
-                    'league': league,
-                    'home_team': home_team,
-                    'away_team': away_team,
-                    'home_score': event['homeScore'].get('current', 0),
-                    'away_score': event['awayScore'].get('current', 0),
-                    'status': event['status']['description'],
-                    'country_name': country_name,
-                }
-            )
-            count += 1
+            row = _parse_live_event(event)
         except Exception as e:
             print(f"Błąd przy zapisie meczu ID {event.get('id')}: {e}")
+            stats['skipped'] += 1
             continue
-
-    print(f"Zakończono! Zsynchronizowano {count} meczów.")
+        # Ten sam mecz dwa razy w feedzie – wygrywa ostatni (jak update_or_create)
+        rows.pop(row['api_id'], None)
+        rows[row['api_id']] = row
+
+    # Także błędne eventy – mecz jest w feedzie, więc nadal trwa
+    _close_dropped_matches([event.get('id') for event in data['events']], stats)
+
+    # 2. Odciski – jedno zapytanie, zapisujemy tylko zmienione mecze
+    known = dict(
+        LiveMatch.objects.filter(api_id__in=list(rows)).values_list('api_id', 'sync_fingerprint')
+    ) if rows else {}
+
+    changed = []
+    for api_id, row in rows.items():
+        fingerprint = _fingerprint(row)
+        if known.get(api_id) == fingerprint:
+            stats['unchanged'] += 1
+            continue
+        changed.append((row, fingerprint))
+
+    if not changed:
+        print(
+            f"Zakończono! Brak zmian (bez zmian: {stats['unchanged']}, pominięte: {stats['skipped']}, "
+            f"zamknięte: {len(stats['closed_api_ids'])})."
+        )
+        return stats
+
+    changed_rows = [row for row, _ in changed]
+
+    # 3. Ligi i drużyny
+    leagues, indexed_leagues = _bulk_upsert_leagues(changed_rows, stats)
+    teams, indexed_teams = _bulk_get_or_create_teams(changed_rows, stats)
+    # bulk_create nie wysyła sygnałów – indeks wyszukiwarki aktualizujemy sami,
+    # tylko dla nowych i przemianowanych (popularność odświeża rebuild_index)
+    search.index_leagues([leagues[api_id] for api_id in indexed_leagues], with_popularity=False)
+    search.index_teams([teams[api_id] for api_id in indexed_teams], with_popularity=False)
+
+    # 4. Mecze – jeden upsert po api_id
+    matches = [
+        LiveMatch(
+            api_id=row['api_id'],
+            league=leagues[row['league']['api_id']],
+            home_team=teams[row['home_team']['api_id']],
+            away_team=teams[row['away_team']['api_id']],
+            home_score=row['home_score'],
+            away_score=row['away_score'],
+            status=row['status'],
+            state=row['state'],
+            kickoff_at=_from_timestamp(row['kickoff_at']),
+            country_name=row['league']['country'],
+            period_started_at=_from_timestamp(row['period_started_at']),
+            sync_fingerprint=fingerprint,
+        )
+        for row, fingerprint in changed
+    ]
+    LiveMatch.objects.bulk_create(
+        matches,
+        update_conflicts=True,
+        unique_fields=['api_id'],
+        update_fields=[
+            'league', 'home_team', 'away_team',
+            'home_score', 'away_score', 'status', 'state', 'kickoff_at', 'country_name',
+            'period_started_at', 'sync_fingerprint',
+        ],
+    )
+    stats['matches_upserted'] = len(matches)
+    stats['changed_api_ids'] = [row['api_id'] for row in changed_rows]
+
+    # Nowe wyniki/statusy → nowa wersja danych meczów i drzewa strony głównej
+    LiveMatch.objects.filter(api_id__in=stats['changed_api_ids']).update(data_version=F('data_version') + 1)
+    bump_home_version()
+    bump_team_versions([m.home_team_id for m in matches] + [m.away_team_id for m in matches])
+
+    print(
+        f"Zakończono! Zsynchronizowano {stats['matches_upserted']} meczów, bez zmian: {stats['unchanged']} "
+        f"(ligi: +{stats['leagues_created']}/~{stats['leagues_updated']}, "
+        f"drużyny: +{stats['teams_created']}, pominięte: {stats['skipped']}, "
+        f"zamknięte: {len(stats['closed_api_ids'])})."
+    )
+    return stats
 
 
 # =============================================================================
@@ -184,7 +381,11 @@ INCIDENT_MAPPERS = {
 
 
 def _map_incident(item):
-    """Mapuje pojedyncze zdarzenie z JSON-a na słownik pól modelu MatchEvent."""
+    """
+    Mapuje pojedyncze zdarzenie z JSON-a na słownik pól modelu MatchEvent.
+    Wzorzec dla map_incidents – używany tylko przez testy i komendę
+    bench_incident_mapper; ingest korzysta z map_incidents.
+    """
     i_type = item.get('incidentType', '')
 
     # Wspólne pola dla każdego zdarzenia
@@ -212,14 +413,434 @@ def _map_incident(item):
     return base
 
 
+# =============================================================================
+#  MAPOWANIE WSADOWE – prekompilowane ekstraktory per typ zdarzenia
+# =============================================================================
+# Te same reguły co INCIDENT_MAPPERS, ale opisane tabelą: dla każdego typu
+# raz budujemy krotkę (pole, ekstraktor), a map_incidents() tylko ją
+# przechodzi – bez dispatchu, _safe_nested(*keys) i łączenia słowników.
+# Wynik musi być identyczny z [_map_incident(i) for i in items]
+# (sprawdzają to testy na korpusie matches/test_data/incidents_corpus.json
+# i komenda bench_incident_mapper).
+
+def _get(key, default=None):
+    """item.get(key, default)"""
+    def extract(item):
+        return item.get(key, default)
+    return extract
+
+
+def _get_or(key, default):
+    """item.get(key) or default"""
+    def extract(item):
+        return item.get(key) or default
+    return extract
+
+
+def _name_or(key, fallback_key, fallback_default=None):
+    """_safe_nested(item, key, 'name') or item.get(fallback_key, fallback_default)"""
+    def extract(item):
+        nested = item.get(key)
+        if isinstance(nested, dict):
+            name = nested.get('name')
+            if name:
+                return name
+        if fallback_key is None:
+            return fallback_default
+        return item.get(fallback_key, fallback_default)
+    return extract
+
+
+def _event_id(item):
+    return str(item.get('id', ''))
+
+
+def _is_home(item):
+    is_home = item.get('isHome')
+    return is_home if is_home is not None else True
+
+
+_BASE_EXTRACTORS = (
+    ('event_id', _event_id),
+    ('time', _get_or('time', 0)),
+    ('added_time', _get_or('addedTime', 0)),
+    ('is_home_team', _is_home),
+)
+
+_TYPE_EXTRACTORS = {
+    'goal': (
+        ('player_name', _name_or('player', 'playerName', '')),
+        ('assist_player_name', _name_or('assist1', 'assist1Name')),
+        ('assist2_player_name', _name_or('assist2', 'assist2Name')),
+        ('home_score', _get('homeScore')),
+        ('away_score', _get('awayScore')),
+        ('incident_class', _get('incidentClass')),
+    ),
+    'card': (
+        ('player_name', _name_or('player', 'playerName', '')),
+        ('incident_class', _get('incidentClass')),
+        ('reason', _get('reason')),
+        ('rescinded', _get('rescinded', False)),
+    ),
+    'substitution': (
+        ('player_in_name', _name_or('playerIn', 'playerNameIn', '')),
+        ('player_out_name', _name_or('playerOut', 'playerNameOut', '')),
+        ('player_name', _name_or('playerIn', 'playerNameIn', '')),
+        ('injury', _get_or('injury', False)),
+    ),
+    'period': (
+        ('text', _get('text')),
+        ('home_score', _get('homeScore')),
+        ('away_score', _get('awayScore')),
+        ('is_live', _get('isLive', False)),
+    ),
+    'injuryTime': (
+        ('length', _get('length')),
+    ),
+    'varDecision': (
+        ('player_name', _name_or('player', 'playerName', '')),
+        ('incident_class', _get('incidentClass')),
+        ('confirmed', _get('confirmed')),
+    ),
+}
+
+# Nieznany typ – zapisujemy co możemy
+_FALLBACK_EXTRACTORS = (
+    ('player_name', _name_or('player', None, '')),
+    ('text', _get('text')),
+    ('incident_class', _get('incidentClass')),
+)
+
+# Pełne tabele (pola wspólne + typowe), budowane raz przy imporcie
+_COMPILED_EXTRACTORS = {
+    i_type: _BASE_EXTRACTORS + extractors
+    for i_type, extractors in _TYPE_EXTRACTORS.items()
+}
+_COMPILED_FALLBACK = _BASE_EXTRACTORS + _FALLBACK_EXTRACTORS
+
+
+def map_incidents(items):
+    """Wsadowy odpowiednik _map_incident: lista zdarzeń z API → lista słowników pól MatchEvent."""
+    compiled = _COMPILED_EXTRACTORS
+    fallback = _COMPILED_FALLBACK
+    result = []
+    append = result.append
+    for item in items:
+        i_type = item.get('incidentType', '')
+        row = {'incident_type': i_type}
+        for field, extract in compiled.get(i_type, fallback):
+            row[field] = extract(item)
+        append(row)
+    return result
+
+
+def build_match_events(match, items):
+    """Lista zdarzeń z API → gotowe do bulk_create instancje MatchEvent."""
+    return [MatchEvent(match=match, **row) for row in map_incidents(items)]
+
+
 # =============================================================================
 #  FETCH MATCH DETAILS – pobieranie zdarzeń i składów
 # =============================================================================
 
-def fetch_match_details(local_match_id, api_match_id):
+def _save_incidents(match, data):
+    """
+    Zapisuje nowe zdarzenia z odpowiedzi /incidents (istniejących nie zmienia).
+    Jeden odczyt zapisanych event_id + jeden bulk_create. Zwraca liczbę nowych rekordów.
+    """
+    incidents = data.get('incidents', [])
+    existing = set(
+        MatchEvent.objects.filter(match=match).exclude(event_id__isnull=True)
+        .exclude(event_id='').order_by().values_list('event_id', flat=True)
+    )
+
+    to_create = []
+    for event in build_match_events(match, incidents):
+        # Unikanie duplikatów po event_id
+        if event.event_id:
+            if event.event_id in existing:
+                continue
+            existing.add(event.event_id)
+        else:
+            event.event_id = None
+        to_create.append(event)
+
+    MatchEvent.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    print(f"Zapisano {len(to_create)} nowych zdarzeń (z {len(incidents)} w API).")
+    return len(to_create)
+
+
+def sync_match_incidents(match, data):
+    """
+    Tryb przyrostowy: porównuje listę zdarzeń z API z zapisanymi event_id
+    (jedno zapytanie) i wykonuje tylko potrzebne zapisy:
+    bulk_create nowych, bulk_update zmienionych (np. rescinded, korekty VAR),
+    usunięcie wycofanych przez API.
+
+    Odpowiedź bez niepustej listy 'incidents' (błąd API, inny kształt
+    odpowiedzi) niczego nie zmienia – nie świadczy o tym, że zdarzenia
+    zniknęły.
+
+    Zwraca słownik {'created', 'updated', 'deleted', 'unchanged'}.
+    """
+    incidents = data.get('incidents') if isinstance(data, dict) else None
+    stats = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    if not isinstance(incidents, list) or not incidents:
+        print("Zdarzenia: brak listy incidents w odpowiedzi – pomijam synchronizację.")
+        return stats
+
+    incoming = {}
+    anonymous = []
+    for mapped in map_incidents(incidents):
+        event_id = mapped.pop('event_id', None)
+        if event_id:
+            incoming[event_id] = mapped
+        else:
+            anonymous.append(mapped)
+
+    existing = {}
+    existing_anonymous = []
+    for event in MatchEvent.objects.filter(match=match):
+        if event.event_id:
+            existing[event.event_id] = event
+        else:
+            existing_anonymous.append(event)
+
+    to_create = []
+    to_update = []
+    update_fields = set()
+    for event_id, mapped in incoming.items():
+        event = existing.pop(event_id, None)
+        if event is None:
+            to_create.append(MatchEvent(match=match, event_id=event_id, **mapped))
+            continue
+
+        changed = [field for field, value in mapped.items() if getattr(event, field) != value]
+        if changed:
+            for field in changed:
+                setattr(event, field, mapped[field])
+            update_fields.update(changed)
+            to_update.append(event)
+        else:
+            stats['unchanged'] += 1
+
+    # Zdarzenia bez id (np. period) porównujemy po pełnej zawartości
+    stale = []
+    for event in existing_anonymous:
+        for i, mapped in enumerate(anonymous):
+            if all(getattr(event, field) == value for field, value in mapped.items()):
+                del anonymous[i]
+                stats['unchanged'] += 1
+                break
+        else:
+            stale.append(event.pk)
+
+    to_create.extend(MatchEvent(match=match, **mapped) for mapped in anonymous)
+    # Wszystko, co zostało w existing, API już nie zwraca
+    stale.extend(event.pk for event in existing.values())
+
+    if stale or to_update or to_create:
+        with transaction.atomic():
+            if stale:
+                MatchEvent.objects.filter(pk__in=stale).delete()
+            if to_update:
+                MatchEvent.objects.bulk_update(to_update, sorted(update_fields))
+            if to_create:
+                MatchEvent.objects.bulk_create(to_create)
+
+    stats['created'] = len(to_create)
+    stats['updated'] = len(to_update)
+    stats['deleted'] = len(stale)
+
+    print(
+        f"Zdarzenia: +{stats['created']} ~{stats['updated']} -{stats['deleted']} "
+        f"(bez zmian: {stats['unchanged']}, w API: {len(incidents)})."
+    )
+    return stats
+
+
+def _lineup_rows(data, is_home):
+    """Zawodnicy jednej drużyny z odpowiedzi /lineups → słowniki pól MatchLineup."""
+    team = data.get('home' if is_home else 'away', {})
+    rows = []
+    for p in team.get('players', []):
+        player_info = p.get('player', {})
+        statistics = p.get('statistics', {})
+        rows.append({
+            'player_name': player_info.get('name', 'Nieznany'),
+            'is_home_team': is_home,
+            'player_api_id': player_info.get('id'),
+            'shirt_number': player_info.get('jerseyNumber') or p.get('shirtNumber'),
+            'position': player_info.get('position'),
+            'is_starting_xi': not p.get('substitute', False),
+            'is_captain': p.get('captain', False) or False,
+            # CharField w modelu – porównujemy jako tekst (odświeżanie ocen)
+            'avg_rating': None if statistics.get('rating') is None else str(statistics.get('rating')),
+        })
+    return rows
+
+
+def _missing_player_rows(data, is_home):
+    """Brakujący gracze jednej drużyny → słowniki pól MissingPlayer."""
+    team = data.get('home' if is_home else 'away', {})
+    rows = []
+    for item in team.get('missingPlayers') or []:
+        player_info = item.get('player', {})
+        if not player_info:
+            continue
+        rows.append({
+            'player_name': player_info.get('name', 'Nieznany'),
+            'is_home_team': is_home,
+            'type': item.get('type', 'missing'),
+            'reason': str(item.get('reason', '')),
+        })
+    return rows
+
+
+def _create_new_players(model, match, rows):
+    """
+    Tworzy wiersze graczy (skład albo brakujący gracze) meczu, których
+    jeszcze nie ma – odpowiednik get_or_create w pętli: jeden odczyt
+    istniejących kluczy (player_name, is_home_team) + jeden bulk_create.
+    Istniejące wiersze zostają bez zmian. Zwraca liczbę utworzonych.
+    """
+    existing = set(model.objects.filter(match=match).values_list('player_name', 'is_home_team'))
+    to_create = []
+    for row in rows:
+        key = (row['player_name'], row['is_home_team'])
+        if key in existing:
+            continue
+        existing.add(key)
+        to_create.append(model(match=match, **row))
+    # ignore_conflicts – unikalny klucz chroni przed równoległym zapisem
+    model.objects.bulk_create(to_create, ignore_conflicts=True)
+    return len(to_create)
+
+
+def _save_lineups(match, data):
+    """Zapisuje formacje, składy i brakujących graczy z odpowiedzi /lineups."""
+    # Zapisz formacje
+    home_formation = data.get('home', {}).get('formation')
+    away_formation = data.get('away', {}).get('formation')
+    if home_formation or away_formation:
+        if home_formation:
+            match.home_formation = home_formation
+        if away_formation:
+            match.away_formation = away_formation
+        match.save(update_fields=['home_formation', 'away_formation'])
+        print(f"Formacje: {home_formation} vs {away_formation}")
+
+    home_players = _lineup_rows(data, is_home=True)
+    away_players = _lineup_rows(data, is_home=False)
+    home_missing = _missing_player_rows(data, is_home=True)
+    away_missing = _missing_player_rows(data, is_home=False)
+
+    _create_new_players(MatchLineup, match, home_players + away_players)
+    _create_new_players(MissingPlayer, match, home_missing + away_missing)
+    search.index_players(row['player_api_id'] for row in home_players + away_players)
+
+    print(f"Zapisano składy (Home: {len(home_players)}, Away: {len(away_players)})")
+    print(f"Zapisano brakujących graczy (Home: {len(home_missing)}, Away: {len(away_missing)})")
+
+
+# Pola składu zmieniające się w trakcie meczu (oceny, opaska, zmiany)
+LINEUP_REFRESH_FIELDS = ['avg_rating', 'is_captain', 'is_starting_xi']
+
+
+def sync_match_lineups(match, data, force=False):
+    """
+    Odświeżanie składów w trakcie meczu. Gdy odcisk odpowiedzi /lineups
+    (lineups_fingerprint) się nie zmienił, nic nie zapisuje. W przeciwnym
+    razie dopisuje nowych graczy (_save_lineups), a istniejącym aktualizuje
+    tylko LINEUP_REFRESH_FIELDS – jeden bulk_update na mecz.
+    force=True: zapis mimo niezmienionego odcisku (np. po usunięciu składów).
+
+    Zwraca słownik {'updated', 'skipped'}.
+    """
+    fingerprint = _fingerprint(data)
+    if not force and match.lineups_fingerprint == fingerprint:
+        return {'updated': 0, 'skipped': True}
+
+    existing = {
+        (lineup.player_name, lineup.is_home_team): lineup
+        for lineup in MatchLineup.objects.filter(match=match)
+    }
+    changed = []
+    seen = set()
+    for row in _lineup_rows(data, is_home=True) + _lineup_rows(data, is_home=False):
+        key = (row['player_name'], row['is_home_team'])
+        lineup = existing.get(key)
+        # Jak przy zapisie – liczy się pierwsze wystąpienie gracza
+        if lineup is None or key in seen:
+            continue
+        seen.add(key)
+        if any(getattr(lineup, field) != row[field] for field in LINEUP_REFRESH_FIELDS):
+            for field in LINEUP_REFRESH_FIELDS:
+                setattr(lineup, field, row[field])
+            changed.append(lineup)
+
+    with transaction.atomic():
+        _save_lineups(match, data)
+        if changed:
+            MatchLineup.objects.bulk_update(changed, LINEUP_REFRESH_FIELDS)
+        match.lineups_fingerprint = fingerprint
+        match.save(update_fields=['lineups_fingerprint'])
+
+    return {'updated': len(changed), 'skipped': False}
+
+
+def store_match_details(match, incidents=None, lineups=None, incremental=True, replace_lineups=False):
+    """
+    Zapisuje pobrane części szczegółów meczu w jednej transakcji – mecz
+    nigdy nie jest widoczny w połowie zapisu, a SQLite robi jeden commit.
+    None = część nie została pobrana (lub bez zmian) i jest pomijana.
+
+    Gdy zdarzenia lub składy się zmieniły, w tej samej transakcji podbija
+    data_version meczu, przelicza jego liczniki zdarzeń (matches.aggregates)
+    i przebudowuje snapshot strony meczu (także gdy snapshotu jeszcze nie
+    ma). Zwraca True, jeśli dane meczu się zmieniły.
+    """
+    if incidents is None and lineups is None:
+        return False
+
+    changed = False
+    with transaction.atomic():
+        if incidents is not None:
+            if incremental:
+                stats = sync_match_incidents(match, incidents)
+                events_changed = bool(stats['created'] or stats['updated'] or stats['deleted'])
+            else:
+                events_changed = _save_incidents(match, incidents) > 0
+            if events_changed:
+                # Liczniki goli/kartek na listach meczów – w tej samej transakcji co zdarzenia
+                refresh_match_aggregates(match)
+            changed |= events_changed
+        if lineups is not None:
+            if replace_lineups:
+                MatchLineup.objects.filter(match=match).delete()
+            changed |= not sync_match_lineups(match, lineups, force=replace_lineups)['skipped']
+
+        if changed:
+            # Unieważnia fragmenty szablonów meczu (klucz z data_version) i strony obu drużyn
+            LiveMatch.objects.filter(pk=match.pk).update(data_version=F('data_version') + 1)
+            # Po commicie – inaczej strony mogłyby zostać przeliczone ze starych danych
+            # (drzewo strony głównej niesie data_version i liczniki meczu)
+            transaction.on_commit(lambda: bump_team_versions([match.home_team_id, match.away_team_id]))
+            transaction.on_commit(bump_home_version)
+        if changed or not MatchDetailSnapshot.objects.filter(match=match).exists():
+            rebuild_detail_snapshot(match)
+
+    return changed
+
+
+def fetch_match_details(local_match_id, api_match_id, incremental=False):
     """
     KROK 3: Pobiera szczegóły meczu (Zdarzenia + Składy).
     Pełne mapowanie JSON → model z obsługą wszystkich typów zdarzeń.
+
+    incremental=True: pobiera dane także dla meczów, które już je mają,
+    i synchronizuje zdarzenia przyrostowo (sync_match_incidents).
     """
     try:
         match = LiveMatch.objects.get(id=local_match_id)
@@ -228,140 +849,115 @@ def fetch_match_details(local_match_id, api_match_id):
         return False
 
     # Ochrona limitu API: Jeśli mamy dane, nie pobieramy ponownie
-    if match.events.exists() or match.lineups.exists():
+    if not incremental and (match.events.exists() or match.lineups.exists()):
         print(f"Mecz {match} ma już dane. Pomijam.")
         return True
 
-    headers = {
-        "x-rapidapi-key": os.getenv("SPORT_API_KEY"),
-        "x-rapidapi-host": "sportapi7.p.rapidapi.com"
-    }
+    client = get_client()
 
     # ==========================================
-    # 1. POBIERANIE ZDARZEŃ (Incidents)
+    # 1. POBIERANIE ZDARZEŃ (Incidents) i SKŁADÓW (Lineups)
     # ==========================================
-    incidents_url = f"https://sportapi7.p.rapidapi.com/api/v1/event/{api_match_id}/incidents"
     print(f"Pobieram zdarzenia dla meczu API ID: {api_match_id}...")
+    response_inc = client.incidents(api_match_id)
+    response_lin = client.lineups(api_match_id)
+    _flush_usage()
 
+    def _payload(response):
+        if response is None or (incremental and response.not_modified):
+            return None
+        return response.data
+
+    # ==========================================
+    # 2. ZAPIS – jedna transakcja
+    # ==========================================
     try:
-        response_inc = requests.get(incidents_url, headers=headers, timeout=10)
-
-        if response_inc.status_code == 200:
-            data = response_inc.json()
-            incidents = data.get('incidents', [])
-            created_count = 0
-
-            for item in incidents:
-                mapped = _map_incident(item)
-
-                # Unikanie duplikatów po event_id
-                event_id = mapped.pop('event_id', None)
-                if event_id:
-                    _, created = MatchEvent.objects.get_or_create(
-                        match=match,
-                        event_id=event_id,
-                        defaults=mapped
-                    )
-                    if created:
-                        created_count += 1
-                else:
-                    MatchEvent.objects.create(match=match, **mapped)
-                    created_count += 1
-
-            print(f"Zapisano {created_count} nowych zdarzeń (z {len(incidents)} w API).")
+        store_match_details(
+            match,
+            incidents=_payload(response_inc),
+            lineups=_payload(response_lin),
+            incremental=incremental,
+        )
+    except Exception as e:
+        print(f"Wyjątek przy zapisie szczegółów meczu {match}: {e}")
+        return False
 
-        else:
-            print(f"Błąd API Incidents: {response_inc.status_code}")
+    return True
 
-    except Exception as e:
-        print(f"Wyjątek przy pobieraniu zdarzeń: {e}")
 
-    # ==========================================
-    # 2. POBIERANIE SKŁADÓW (Lineups)
-    # ==========================================
-    lineups_url = f"https://sportapi7.p.rapidapi.com/api/v1/event/{api_match_id}/lineups"
+# =============================================================================
+#  WSPÓŁBIEŻNE POBIERANIE SZCZEGÓŁÓW – wiele meczów naraz
+# =============================================================================
 
-    try:
-        response_lin = requests.get(lineups_url, headers=headers, timeout=10)
-
-        if response_lin.status_code == 200:
-            data = response_lin.json()
-
-            # Zapisz formacje
-            home_formation = data.get('home', {}).get('formation')
-            away_formation = data.get('away', {}).get('formation')
-            if home_formation or away_formation:
-                if home_formation:
-                    match.home_formation = home_formation
-                if away_formation:
-                    match.away_formation = away_formation
-                match.save()
-                print(f"Formacje: {home_formation} vs {away_formation}")
-
-            def _save_players(players_list, is_home):
-                count = 0
-                for p in players_list:
-                    player_info = p.get('player', {})
-                    statistics = p.get('statistics', {})
-
-                    MatchLineup.objects.get_or_create(
-                        match=match,
-                        player_name=player_info.get('name', 'Nieznany'),
-                        is_home_team=is_home,
-                        defaults={
-                            'player_api_id': player_info.get('id'),
-                            'shirt_number': player_info.get('jerseyNumber') or p.get('shirtNumber'),
-                            'position': player_info.get('position'),
-                            'is_starting_xi': not p.get('substitute', False),
-                            'is_captain': p.get('captain', False) or False,
-                            'avg_rating': statistics.get('rating'),
-                        }
-                    )
-                    count += 1
-                return count
-
-            def _save_missing_players(missing_list, is_home):
-                count = 0
-                if not missing_list:
-                    return 0
-                
-                for item in missing_list:
-                    player_info = item.get('player', {})
-                    if not player_info:
-                        continue
-                        
-                    MissingPlayer.objects.get_or_create(
-                        match=match,
-                        player_name=player_info.get('name', 'Nieznany'),
-                        is_home_team=is_home,
-                        defaults={
-                            'type': item.get('type', 'missing'),
-                            'reason': str(item.get('reason', '')),
-                        }
-                    )
-                    count += 1
-                return count
-
-            # --- GOSPODARZE ---
-            home_data = data.get('home', {})
-            home_players = home_data.get('players', [])
-            home_missing = home_data.get('missingPlayers', [])
-            
-            home_count = _save_players(home_players, is_home=True)
-            home_missing_count = _save_missing_players(home_missing, is_home=True)
-
-            # --- GOŚCIE ---
-            away_data = data.get('away', {})
-            away_players = away_data.get('players', [])
-            away_missing = away_data.get('missingPlayers', [])
-            
-            away_count = _save_players(away_players, is_home=False)
-            away_missing_count = _save_missing_players(away_missing, is_home=False)
-
-            print(f"Zapisano składy (Home: {home_count}, Away: {away_count})")
-            print(f"Zapisano brakujących graczy (Home: {home_missing_count}, Away: {away_missing_count})")
+def ingest_many_match_details(matches, replace=False, priority=None, **fetch_options):
+    """
+    Pobiera zdarzenia i składy wielu meczów równolegle (fetcher.fetch_many_details),
+    a zapis do bazy wykonuje w bieżącym wątku – jeden writer, bez współbieżnych
+    transakcji SQLite; każdy mecz zapisywany jest w jednej transakcji
+    (store_match_details).
 
-    except Exception as e:
-        print(f"Wyjątek przy pobieraniu składów: {e}")
+    Zdarzenia są zawsze synchronizowane przyrostowo (sync_match_incidents).
+    replace=True: przed zapisem usuwa stare składy meczu, ale tylko gdy nowe
+    udało się pobrać (używane przez reimport_events). Bez replace części,
+    dla których API odpowiedziało 304, są pomijane.
+
+    priority: jeśli podany, mecze przechodzą przez budżet API (budget.admit)
+    i przy kończącym się limicie część z nich jest pomijana ('shed').
+
+    Zwraca słownik {'matches', 'incidents', 'lineups', 'failed', 'shed',
+    'skipped_ids'} – skipped_ids to ID meczów nieudanych i pominiętych.
+    """
+    stats = {'matches': 0, 'incidents': 0, 'lineups': 0, 'failed': 0, 'shed': 0, 'skipped_ids': []}
+
+    if priority is not None:
+        matches, shed = budget.admit(((priority, m) for m in matches), cost=len(DETAIL_ENDPOINTS))
+        stats['shed'] = len(shed)
+        stats['skipped_ids'].extend(m.id for m in shed)
+        if shed:
+            print(f"Budżet API: pominięto {len(shed)} meczów (priorytet {priority}).")
+
+    for result in fetch_many_details(matches, **fetch_options):
+        match = result.match
+        stats['matches'] += 1
+        _flush_usage()
+        if result.incidents is None and result.lineups is None:
+            stats['failed'] += 1
+            stats['skipped_ids'].append(match.id)
+            print(f"Nie udało się pobrać szczegółów meczu {match} (api_id={match.api_id}).")
+            continue
+
+        incidents = result.incidents
+        if incidents is not None and not replace and 'incidents' in result.not_modified:
+            incidents = None
+        lineups = result.lineups
+        if lineups is not None and not replace and 'lineups' in result.not_modified:
+            lineups = None
+
+        store_match_details(match, incidents=incidents, lineups=lineups, replace_lineups=replace)
+        stats['incidents'] += incidents is not None
+        stats['lineups'] += lineups is not None
+
+    return stats
+
+
+# =============================================================================
+#  ODTWARZANIE Z ARCHIWUM – reimport bez zapytań do API
+# =============================================================================
+
+def replay_match_from_archive(match):
+    """
+    Odtwarza zdarzenia i składy meczu z najnowszych zarchiwizowanych
+    odpowiedzi (archive.latest) – zero zapytań sieciowych. Zwraca zbiór
+    odtworzonych części, np. {'incidents', 'lineups'}.
+    """
+    replayed = set()
+    incidents = archive.latest('incidents', match.api_id)
+    lineups = archive.latest('lineups', match.api_id)
+
+    store_match_details(match, incidents=incidents, lineups=lineups, replace_lineups=True)
+    if incidents is not None:
+        replayed.add('incidents')
+    if lineups is not None:
+        replayed.add('lineups')
 
-    return True
\ No newline at end of file
+    return replayed
@@ -0,0 +1,171 @@
+"""
+Snapshot bazy dla ruchu WWW.
+
+Celery zapisuje do głównej bazy ('default'), a strony czytają z kopii
+tylko do odczytu ('snapshot'), odświeżanej co SNAPSHOT_REFRESH_INTERVAL
+sekund przez API kopii zapasowej SQLite (sqlite3.Connection.backup).
+Kopia powstaje w pliku tymczasowym i podmieniana jest atomowo (os.replace),
+więc czytelnicy nigdy nie konkurują o blokady z writerem.
+
+- SnapshotReadMiddleware kieruje odczyty modeli aplikacji matches w żądaniach
+  GET/HEAD na snapshot – poza ścieżkami z SNAPSHOT_PINNED_PATHS (admin musi
+  widzieć własne zapisy) i poza sytuacją, gdy snapshot jest starszy niż
+  SNAPSHOT_MAX_AGE (np. zatrzymany beat).
+- SnapshotRouter: zapisy, Celery i komendy zawsze idą do 'default'.
+- use_primary() wymusza bazę główną w bloku kodu (read-your-writes).
+  Z bazy głównej budowane są też wpisy cache kluczowane wersją z cache
+  (drzewo strony głównej, strona drużyny): sync podbija wersję od razu,
+  a snapshot może być jeszcze sprzed zmiany – zbudowana z niego wartość
+  zostałaby pod nową wersją aż do wygaśnięcia (from_primary).
+
+Włączenie: DATABASE_SNAPSHOT_PATH w settings albo w .env.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SNAPSHOT_ALIAS = 'snapshot'
+
+DEFAULT_MAX_AGE = 120
+DEFAULT_PINNED_PATHS = ('/admin/',)
+
+# Alias, z którego czytamy w bieżącym żądaniu (None = baza główna)
+_read_alias = ContextVar('snapshot_read_alias', default=None)
+
+
+def snapshot_path():
+    path = getattr(settings, 'DATABASE_SNAPSHOT_PATH', None)
+    return Path(path) if path else None
+
+
+def snapshot_enabled():
+    return snapshot_path() is not None
+
+
+def snapshot_age(path=None):
+    """Wiek snapshotu w sekundach albo None, gdy jeszcze nie istnieje."""
+    path = path or snapshot_path()
+    try:
+        return max(0.0, time.time() - os.stat(path).st_mtime)
+    except (OSError, TypeError):
+        return None
+
+
+def snapshot_fresh():
+    age = snapshot_age()
+    return age is not None and age <= getattr(settings, 'SNAPSHOT_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def refresh_snapshot(source=None, target=None):
+    """
+    Kopiuje bazę główną do pliku snapshotu (API kopii zapasowej SQLite –
+    spójny obraz także w trakcie zapisów) i atomowo podmienia plik.
+    Zwraca słownik {'path', 'bytes', 'seconds'}.
+    """
+    source = Path(source or settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+    target = Path(target or snapshot_path())
+    tmp = target.with_name(target.name + '.tmp')
+    started = time.monotonic()
+
+    if tmp.exists():
+        tmp.unlink()
+    src = sqlite3.connect(source, timeout=30)
+    try:
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            # Kopia jest tylko do odczytu i podmieniana w całości – bez plików -wal/-shm
+            dst.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp, target)
+
+    return {
+        'path': str(target),
+        'bytes': target.stat().st_size,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+@contextmanager
+def use_primary():
+    """Odczyty w bloku idą do bazy głównej (np. zaraz po zapisie)."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def from_primary(func, *args, **kwargs):
+    """Wynik func(*args, **kwargs) z odczytami z bazy głównej."""
+    with use_primary():
+        return func(*args, **kwargs)
+
+
+@contextmanager
+def use_snapshot():
+    token = _read_alias.set(SNAPSHOT_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def reads_from_snapshot(request):
+    """Czy żądanie może czytać ze snapshotu."""
+    if request.method not in ('GET', 'HEAD') or not snapshot_enabled():
+        return False
+    pinned = getattr(settings, 'SNAPSHOT_PINNED_PATHS', DEFAULT_PINNED_PATHS)
+    if any(request.path.startswith(prefix) for prefix in pinned):
+        return False
+    return snapshot_fresh()
+
+
+class SnapshotReadMiddleware:
+    """Odczyty w żądaniach stron idą do snapshotu (patrz reads_from_snapshot)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not reads_from_snapshot(request):
+            return self.get_response(request)
+        with use_snapshot():
+            return self.get_response(request)
+
+
+class SnapshotRouter:
+    """
+    Odczyty modeli aplikacji matches → snapshot, gdy włączył go middleware;
+    sesje, użytkownicy i wszystkie zapisy → baza główna.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias and model._meta.app_label == 'matches':
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Jawnie 'default' – obiekt odczytany ze snapshotu zapisuje się do bazy głównej
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, SNAPSHOT_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Snapshot jest kopią bazy głównej – migracje tylko tam
+        if db == SNAPSHOT_ALIAS:
+            return False
+        return None
@@ -0,0 +1,67 @@
+"""
+Strojenie SQLite dla równoczesnej pracy writerów (Celery) i readerów (gunicorn).
+
+Przy każdym nowym połączeniu (sygnał connection_created) ustawiamy PRAGMA
+z DEFAULT_PRAGMAS (settings.SQLITE_PRAGMAS tylko je nadpisuje):
+  - journal_mode=WAL – czytelnicy nie czekają na writera i odwrotnie,
+  - synchronous=NORMAL – w trybie WAL bezpieczne, a dużo tańsze niż FULL,
+  - mmap_size / cache_size / temp_store – mniej odczytów z dysku,
+  - busy_timeout – zamiast "database is locked" połączenie czeka na blokadę.
+
+Zapisy rozpoczynają transakcję od razu jako IMMEDIATE
+(DATABASES['default']['OPTIONS']['transaction_mode']) – blokada zapisu jest
+brana na początku, więc transakcja "odczyt, potem zapis" nie kończy się
+błędem przy próbie podniesienia blokady.
+"""
+import re
+
+from django.conf import settings
+
+from .snapshot import SNAPSHOT_ALIAS
+
+# Kolejność ma znaczenie: busy_timeout najpierw, żeby zmiana journal_mode
+# też czekała na blokadę
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 20000,     # ms
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,    # 256 MB
+    'cache_size': -65536,      # ujemne = KiB, tu 64 MB
+    'temp_store': 'MEMORY',
+}
+
+# PRAGMA zmieniające plik bazy – pomijane na kopii tylko do odczytu (snapshot)
+_WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def get_pragmas(alias=None):
+    """
+    PRAGMA do ustawienia: DEFAULT_PRAGMAS nadpisane przez SQLITE_PRAGMAS
+    (wartość None pomija daną PRAGMA).
+    """
+    pragmas = {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    pragmas = {name: value for name, value in pragmas.items() if value is not None}
+    if alias == SNAPSHOT_ALIAS and pragmas:
+        pragmas = {name: value for name, value in pragmas.items() if name not in _WRITE_PRAGMAS}
+        pragmas['query_only'] = 'ON'
+    return pragmas
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Ustawia PRAGMA na połączeniu Django z SQLite (inne bazy są pomijane)."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas(connection.alias) if pragmas is None else pragmas
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # PRAGMA nie przyjmuje parametrów – wartości muszą być proste
+            if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+                raise ValueError(f"Niepoprawne PRAGMA: {name}={value!r}")
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def on_connection_created(sender, connection, **kwargs):
+    apply_pragmas(connection)
@@ -0,0 +1,132 @@
+"""
+Znormalizowany stan meczu (LiveMatch.state) zamiast wolnego tekstu status.
+
+API podaje status jako {'code', 'type', 'description'}. Stan wyliczamy
+kolejno z kodu, typu i – dla starych danych, gdzie zapisany jest tylko
+opis – z fragmentów opisu.
+
+Mecz w stanie aktywnym dłużej niż MATCH_STALE_AFTER_HOURS po planowym
+początku uznajemy za "zawieszony" (np. nikt nie zamknął go po zniknięciu
+z feedu) – filtry list i harmonogram go pomijają.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+NOT_STARTED = 'not_started'
+IN_PLAY = 'in_play'
+HALF_TIME = 'half_time'
+INTERRUPTED = 'interrupted'
+FINISHED = 'finished'
+POSTPONED = 'postponed'
+CANCELLED = 'cancelled'
+
+STATE_CHOICES = [
+    (NOT_STARTED, 'Nie rozpoczęty'),
+    (IN_PLAY, 'W trakcie'),
+    (HALF_TIME, 'Przerwa'),
+    (INTERRUPTED, 'Przerwany'),
+    (FINISHED, 'Zakończony'),
+    (POSTPONED, 'Przełożony'),
+    (CANCELLED, 'Odwołany'),
+]
+
+# Mecz "na żywo" – trwa albo jest chwilowo wstrzymany
+LIVE_STATES = (IN_PLAY, HALF_TIME, INTERRUPTED)
+# Mecz, którego już nie odpytujemy
+ENDED_STATES = (FINISHED, POSTPONED, CANCELLED)
+# Pozostałe: zaplanowany albo na żywo
+ACTIVE_STATES = (NOT_STARTED,) + LIVE_STATES
+
+DEFAULT_STALE_AFTER_HOURS = 4
+
+# status.code z API
+_CODES = {
+    0: NOT_STARTED,
+    6: IN_PLAY, 7: IN_PLAY,            # 1. / 2. połowa
+    41: IN_PLAY, 42: IN_PLAY,          # dogrywka
+    50: IN_PLAY,                       # rzuty karne
+    31: HALF_TIME,                     # przerwa
+    32: HALF_TIME, 33: HALF_TIME,      # przed dogrywką / przerwa w dogrywce
+    34: HALF_TIME,                     # przed rzutami karnymi
+    60: POSTPONED,
+    70: CANCELLED,
+    80: INTERRUPTED,
+    90: CANCELLED,                     # przerwany definitywnie (abandoned)
+    100: FINISHED, 110: FINISHED, 120: FINISHED,  # FT / AET / AP
+}
+
+# status.type z API
+_TYPES = {
+    'notstarted': NOT_STARTED,
+    'inprogress': IN_PLAY,
+    'finished': FINISHED,
+    'postponed': POSTPONED,
+    'canceled': CANCELLED,
+    'cancelled': CANCELLED,
+    'interrupted': INTERRUPTED,
+    'suspended': INTERRUPTED,
+    'delayed': INTERRUPTED,
+}
+
+# Fragmenty opisu – kolejność ma znaczenie (pierwsze trafienie wygrywa)
+_DESCRIPTION_MARKERS = (
+    (POSTPONED, ('postponed',)),
+    (CANCELLED, ('canceled', 'cancelled', 'abandoned', 'removed')),
+    (FINISHED, ('ended', 'finished', 'after')),
+    (INTERRUPTED, ('interrupted', 'suspended', 'delayed')),
+    (HALF_TIME, ('halftime', 'half time', 'break', 'pause', 'awaiting')),
+    (IN_PLAY, ('half', 'extra', 'penalties', 'overtime')),
+)
+_FINISHED_CODES = ('ft', 'aet', 'ap')
+
+
+def state_from_description(description):
+    """Opis statusu (status.description) → stan."""
+    text = (description or '').strip().lower()
+    if not text or text == 'not started':
+        return NOT_STARTED
+    if text in _FINISHED_CODES:
+        return FINISHED
+    for state, markers in _DESCRIPTION_MARKERS:
+        if any(marker in text for marker in markers):
+            return state
+    return NOT_STARTED
+
+
+def normalize_status(status):
+    """Obiekt status z API (albo sam opis) → stan."""
+    if not isinstance(status, dict):
+        return state_from_description(status)
+    state = _CODES.get(status.get('code'))
+    if state:
+        return state
+    from_description = state_from_description(status.get('description'))
+    if status.get('type') == 'inprogress':
+        # inprogress obejmuje też przerwy – rozróżnia je dopiero opis
+        return from_description if from_description in LIVE_STATES else IN_PLAY
+    return _TYPES.get(status.get('type')) or from_description
+
+
+def stale_cutoff(now=None):
+    """Mecze aktywne z kickoff_at wcześniejszym niż ta chwila są "zawieszone"."""
+    hours = getattr(settings, 'MATCH_STALE_AFTER_HOURS', DEFAULT_STALE_AFTER_HOURS)
+    return (now or timezone.now()) - timedelta(hours=hours)
+
+
+def current_q(states, now=None):
+    """Filtr: mecze w stanach states, które nie są zawieszone (zakres po indeksie (state, kickoff_at))."""
+    return Q(state__in=states, kickoff_at__gte=stale_cutoff(now))
+
+
+def stale_q(now=None):
+    """Filtr: mecze zawieszone w stanie aktywnym."""
+    return Q(state__in=ACTIVE_STATES, kickoff_at__lt=stale_cutoff(now))
+
+
+def is_stale(match, now=None):
+    """Czy mecz jest zawieszony (bez kickoff_at – nie wiemy, decyduje feed)."""
+    return (match.state in ACTIVE_STATES and match.kickoff_at is not None
+            and match.kickoff_at < stale_cutoff(now))
@@ -1,9 +1,137 @@
-from celery import shared_task
-from .services import sync_live_matches
+import time
+import uuid
+from contextlib import contextmanager
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import scheduler, search, snapshot
+from .models import LiveMatch
+from .services import fetch_match_details, sync_live_matches
+
+INGEST_LOCK_KEY = 'lock:ingest-match:{}'
+DEFAULT_INGEST_LOCK_TIMEOUT = 300
+
+
+# Cache widoczny tylko w jednym procesie – blokada nie chroniłaby przed innymi workerami
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+@contextmanager
+def match_lock(match_id, cache=None):
+    """
+    Blokada per mecz (cache.add jest atomowe) – dwa nakładające się
+    uruchomienia nigdy nie przetwarzają tego samego meczu jednocześnie.
+    Wymaga cache współdzielonego przez workery (Redis); przy cache lokalnym
+    procesu rzuca ImproperlyConfigured.
+    Zwraca True, jeśli blokadę udało się założyć.
+    """
+    cache = cache or caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(cache, LOCAL_CACHE_BACKENDS):
+        raise ImproperlyConfigured(
+            f"match_lock wymaga cache współdzielonego przez workery (np. Redis), "
+            f"a skonfigurowany jest {type(cache).__name__}."
+        )
+    key = INGEST_LOCK_KEY.format(match_id)
+    token = uuid.uuid4().hex
+    timeout = getattr(settings, 'INGEST_LOCK_TIMEOUT', DEFAULT_INGEST_LOCK_TIMEOUT)
+    acquired = cache.add(key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        # Zwalniamy tylko własną blokadę (mogła wygasnąć i zostać przejęta)
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+@shared_task
+def ingest_match_details(match_id):
+    """Pobiera szczegóły jednego meczu (przyrostowo). Idempotentne."""
+    started = time.monotonic()
+    with match_lock(match_id) as acquired:
+        if not acquired:
+            return {'match_id': match_id, 'status': 'locked', 'seconds': 0.0}
+
+        try:
+            match = LiveMatch.objects.get(id=match_id)
+        except LiveMatch.DoesNotExist:
+            return {'match_id': match_id, 'status': 'missing', 'seconds': 0.0}
+
+        ok = fetch_match_details(match.id, match.api_id, incremental=True)
+        return {
+            'match_id': match_id,
+            'status': 'ok' if ok else 'failed',
+            'seconds': round(time.monotonic() - started, 3),
+        }
+
+
+@shared_task
+def summarize_ingest(results, started_at):
+    """Callback chorda: podsumowanie rozproszonego pobierania szczegółów."""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    timings = [r['seconds'] for r in results if r['status'] == 'ok']
+
+    summary = {
+        'matches': len(results),
+        'statuses': counts,
+        'wall_seconds': round(time.time() - started_at, 3),
+        'max_seconds': max(timings, default=0.0),
+        'avg_seconds': round(sum(timings) / len(timings), 3) if timings else 0.0,
+    }
+    print(f"Celery: Szczegóły meczów pobrane: {summary}")
+    return summary
+
+
+def dispatch_detail_ingest(match_ids):
+    """Jeden subtask na mecz (group) + podsumowanie (chord). Zwraca AsyncResult albo None."""
+    match_ids = list(match_ids)
+    if not match_ids:
+        return None
+    header = [ingest_match_details.s(match_id) for match_id in match_ids]
+    return chord(header)(summarize_ingest.s(time.time()))
+
 
 @shared_task
 def sync_football_data():
     """To zadanie pobiera mecze w tle nie blokując działania strony."""
     print("Celery: Rozpoczynam pobieranie meczów z API...")
-    sync_live_matches()
-    return "Mecze zaktualizowane pomyślnie!"
\ No newline at end of file
+    stats = sync_live_matches()
+
+    changed_ids = LiveMatch.objects.filter(
+        api_id__in=stats['changed_api_ids'] + stats['closed_api_ids']
+    ).values_list('id', flat=True)
+    dispatch_detail_ingest(changed_ids)
+
+    return (
+        f"Mecze zaktualizowane pomyślnie! "
+        f"Zapisane: {stats['matches_upserted']}, bez zmian: {stats['unchanged']}, błędne: {stats['skipped']}"
+    )
+
+
+@shared_task
+def scheduler_tick():
+    """Co minutę: live feed i szczegóły meczów tylko wtedy, gdy minął ich termin."""
+    summary = scheduler.run_tick(ingest=lambda matches: dispatch_detail_ingest(m.id for m in matches))
+    return f"Scheduler: {summary}"
+
+
+@shared_task
+def refresh_database_snapshot():
+    """Odświeża kopię bazy, z której czytają strony (matches.snapshot)."""
+    if not snapshot.snapshot_enabled():
+        return "Snapshot wyłączony."
+    stats = snapshot.refresh_snapshot()
+    return f"Snapshot odświeżony: {stats['bytes']} B w {stats['seconds']} s"
+
+
+@shared_task
+def rebuild_search_index():
+    """Pełna przebudowa indeksu wyszukiwarki (matches.search)."""
+    stats = search.rebuild_index()
+    return f"Indeks wyszukiwarki: {stats}"
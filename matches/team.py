@@ -0,0 +1,108 @@
+"""
+Dane strony drużyny: ostatnie mecze i skład zagregowany z kilku meczów.
+
+- Ostatnie mecze: UNION dwóch zapytań (gospodarz / gość), każde po
+  indeksie (home_team, id) / (away_team, id) – zamiast OR, którego SQLite
+  nie potrafi dobrze obsłużyć indeksem.
+- Skład: jedno zapytanie z GROUP BY po graczu z ostatnich
+  TEAM_SQUAD_MATCHES meczów (występy, w pierwszym składzie, średnia ocena).
+- Wynik w cache per drużyna pod kluczem z jej wersją; sync i ingest
+  szczegółów zmieniają wersję drużyn, których mecze się zmieniły.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, FloatField, Max, Q
+from django.db.models.functions import Cast
+
+from . import snapshot
+from .caching import get_or_compute
+from .models import LiveMatch, MatchLineup
+
+TEAM_VERSION_KEY = 'team:{}:version'
+TEAM_PAGE_KEY = 'team:{}:page:{}'
+
+DEFAULT_RECENT_MATCHES = 20
+DEFAULT_SQUAD_MATCHES = 5
+DEFAULT_PAGE_TIMEOUT = 600
+
+RECENT_MATCH_FIELDS = (
+    'id', 'home_score', 'away_score', 'home_team_id', 'away_team_id',
+    'home_team__name', 'away_team__name', 'league__name',
+)
+
+
+def team_version(team_id):
+    return cache.get_or_set(TEAM_VERSION_KEY.format(team_id), lambda: uuid.uuid4().hex, timeout=None)
+
+
+def bump_team_versions(team_ids):
+    """Unieważnia strony drużyn (jeden zapis do cache dla całej listy)."""
+    team_ids = {team_id for team_id in team_ids if team_id is not None}
+    if team_ids:
+        token = uuid.uuid4().hex
+        cache.set_many({TEAM_VERSION_KEY.format(team_id): token for team_id in team_ids}, timeout=None)
+
+
+def recent_match_ids(team_id, limit):
+    """ID ostatnich meczów drużyny, najnowsze pierwsze (UNION po dwóch indeksach)."""
+    home = LiveMatch.objects.filter(home_team_id=team_id).values_list('id', flat=True)
+    away = LiveMatch.objects.filter(away_team_id=team_id).values_list('id', flat=True)
+    return list(home.union(away).order_by('-id')[:limit])
+
+
+def aggregate_squad(team_id, matches):
+    """
+    Gracze drużyny z podanych meczów (wiersze RECENT_MATCH_FIELDS) – jedno
+    zapytanie z GROUP BY: występy, mecze w pierwszym składzie, średnia ocena.
+    """
+    home_ids = [m['id'] for m in matches if m['home_team_id'] == team_id]
+    away_ids = [m['id'] for m in matches if m['away_team_id'] == team_id]
+    if not home_ids and not away_ids:
+        return []
+
+    return list(
+        MatchLineup.objects
+        .filter(Q(match_id__in=home_ids, is_home_team=True) | Q(match_id__in=away_ids, is_home_team=False))
+        .values('player_name')
+        .annotate(
+            appearances=Count('id'),
+            starts=Count('id', filter=Q(is_starting_xi=True)),
+            captaincies=Count('id', filter=Q(is_captain=True)),
+            # avg_rating to tekst z API – puste i NULL pomija AVG
+            avg_rating=Avg(Cast('avg_rating', FloatField()), filter=Q(avg_rating__gt='')),
+            shirt_number=Max('shirt_number'),
+            position=Max('position'),
+        )
+        .order_by('-starts', '-appearances', 'shirt_number', 'player_name')
+    )
+
+
+def build_team_page(team_id):
+    """Dane strony drużyny: {'recent_matches', 'squad', 'squad_matches'}."""
+    recent_limit = getattr(settings, 'TEAM_RECENT_MATCHES', DEFAULT_RECENT_MATCHES)
+    squad_limit = getattr(settings, 'TEAM_SQUAD_MATCHES', DEFAULT_SQUAD_MATCHES)
+
+    ids = recent_match_ids(team_id, recent_limit)
+    rows = {row['id']: row for row in LiveMatch.objects.filter(id__in=ids).values(*RECENT_MATCH_FIELDS)}
+    recent = [rows[match_id] for match_id in ids if match_id in rows]
+
+    squad_matches = recent[:squad_limit]
+    return {
+        'recent_matches': recent,
+        'squad': aggregate_squad(team_id, squad_matches),
+        'squad_matches': len(squad_matches),
+    }
+
+
+def get_team_page(team_id):
+    """
+    Dane strony drużyny z cache (klucz z wersją drużyny) albo zbudowane od
+    nowa z bazy głównej (snapshot może być starszy niż wersja).
+    """
+    return get_or_compute(
+        TEAM_PAGE_KEY.format(team_id, team_version(team_id)),
+        lambda: snapshot.from_primary(build_team_page, team_id),
+        timeout=getattr(settings, 'TEAM_PAGE_CACHE_TIMEOUT', DEFAULT_PAGE_TIMEOUT),
+    )
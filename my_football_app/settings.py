@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
@@ -51,6 +52,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Odczyty stron ze snapshotu bazy (aktywne tylko z DATABASE_SNAPSHOT_PATH)
+    'matches.snapshot.SnapshotReadMiddleware',
 ]
 
 ROOT_URLCONF = 'my_football_app.urls'
@@ -65,6 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'matches.context_processors.fragment_cache',
             ],
         },
     },
@@ -80,9 +84,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transakcje od razu biorą blokadę zapisu (BEGIN IMMEDIATE)
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Snapshot bazy dla ruchu WWW (matches.snapshot): strony czytają z kopii
+# odświeżanej przez beat, Celery zapisuje do bazy głównej.
+# Włączenie: DATABASE_SNAPSHOT_PATH w .env (np. db.snapshot.sqlite3)
+DATABASE_SNAPSHOT_PATH = os.getenv('DATABASE_SNAPSHOT_PATH') or None
+# Co ile sekund beat odświeża snapshot
+SNAPSHOT_REFRESH_INTERVAL = 30
+
+if DATABASE_SNAPSHOT_PATH:
+    DATABASES['snapshot'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_SNAPSHOT_PATH,
+        # W testach snapshot to ta sama baza co 'default'
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['matches.snapshot.SnapshotRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -140,22 +164,88 @@ CELERY_RESULT_SERIALIZER = 'json'
 # Strefa czasowa dla zadań automatycznych (np. żeby o 15:00 znaczyło 15:00 w Polsce)
 CELERY_TIMEZONE = 'Europe/Warsaw'
 
+# ==========================================
+# SPORT API (RapidAPI)
+# ==========================================
+# Klucz i host czytane z .env (SPORT_API_KEY, SPORT_API_HOST).
+# Nadpisanie adresu API, np. lokalny stub w testach (None = https://<host>/api/v1)
+SPORT_API_BASE_URL = os.getenv("SPORT_API_BASE_URL") or None
+# Limity planu RapidAPI (None = bez limitu) – liczniki w matches.ApiUsage
+SPORT_API_PLAN = {
+    'daily': None,
+    'monthly': 30000,
+}
+# Ligi (tournament id z API) traktowane priorytetowo: PL, LaLiga, Bundesliga,
+# Serie A, Ligue 1, Liga Mistrzów, Ekstraklasa
+TOP_LEAGUE_IDS = [17, 8, 35, 23, 34, 7, 202]
+
 
 from celery.schedules import crontab
 # ==========================================
 # CELERY BEAT (Harmonogram zadań)
 # ==========================================
 CELERY_BEAT_SCHEDULE = {
-    'pobieraj-mecze-co-5-minut': {
-        'task': 'matches.tasks.sync_football_data',
-        # Wykonuj co 5 minut (zmień na '*/1' jeśli chcesz co minutę do testów)
-        'schedule': crontab(minute='*/10'),
+    # Co minutę sprawdzamy, co jest "do pobrania" – właściwe odstępy
+    # wylicza matches.scheduler na podstawie statusu meczów
+    'harmonogram-odpytywania': {
+        'task': 'matches.tasks.scheduler_tick',
+        'schedule': crontab(minute='*'),
     },
 }
 
+# Raz na dobę – pełna przebudowa indeksu wyszukiwarki (popularność, usunięte obiekty)
+CELERY_BEAT_SCHEDULE['przebudowa-indeksu-wyszukiwarki'] = {
+    'task': 'matches.tasks.rebuild_search_index',
+    'schedule': crontab(hour=4, minute=30),
+}
+
+if DATABASE_SNAPSHOT_PATH:
+    CELERY_BEAT_SCHEDULE['odswiezanie-snapshotu'] = {
+        'task': 'matches.tasks.refresh_database_snapshot',
+        'schedule': SNAPSHOT_REFRESH_INTERVAL,
+    }
+
+# ==========================================
+# CACHE (wspólny dla gunicorna i Celery)
+# ==========================================
+# Redis – ten sam serwer co broker Celery, osobna baza (1). Unieważnienia
+# z workera Celery (wersje drzewa, data_version, blokady) widzą wszystkie procesy.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'varify',
     }
-}
\ No newline at end of file
+}
+# Praca bez Redisa (CACHE_FAKE_REDIS=1): fakeredis w pamięci procesu.
+# manage.py test włącza go sam (TEST_RUNNER niżej)
+if os.getenv('CACHE_FAKE_REDIS') == '1':
+    import fakeredis
+    CACHES['default']['OPTIONS'] = {'connection_class': fakeredis.FakeConnection}
+TEST_RUNNER = 'my_football_app.test_runner.FakeRedisTestRunner'
+
+# ==========================================
+# STROJENIE APLIKACJI matches
+# ==========================================
+# Wartości domyślne są w modułach (stałe DEFAULT_*) – tutaj ustawiamy tylko
+# to, co ma być inne. Słowniki są łączone z domyślnymi, więc wystarczy podać
+# zmieniane klucze, np. SCHEDULER_POLL_INTERVALS = {'in_play': 90}.
+#
+#   matches.sqlite_tuning      SQLITE_PRAGMAS (wartość None pomija daną PRAGMA)
+#   matches.snapshot           SNAPSHOT_MAX_AGE, SNAPSHOT_PINNED_PATHS
+#   matches.client             SPORT_API_POOL_SIZE, SPORT_API_MAX_RETRIES, SPORT_API_BACKOFF_BASE,
+#                              SPORT_API_BACKOFF_MAX, SPORT_API_TIMEOUTS, SPORT_API_RATE_PER_SECOND,
+#                              SPORT_API_RATE_BURST
+#   matches.fetcher            SPORT_API_MAX_IN_FLIGHT
+#   matches.budget             SPORT_API_SHED_THRESHOLDS
+#   matches.archive            RAW_ARCHIVE_ENABLED, RAW_ARCHIVE_DIR
+#   matches.scheduler          SCHEDULER_POLL_INTERVALS, SCHEDULER_CLOSING_MINUTE, SCHEDULER_FEED_INTERVAL,
+#                              SCHEDULER_FEED_MAX_INTERVAL, SCHEDULER_MAX_DETAILS_PER_TICK
+#   matches.tasks              INGEST_LOCK_TIMEOUT
+#   matches.status             MATCH_STALE_AFTER_HOURS
+#   matches.home               HOME_COUNTRIES_PER_PAGE, HOME_TREE_CACHE_TIMEOUT
+#   matches.team               TEAM_RECENT_MATCHES, TEAM_SQUAD_MATCHES, TEAM_PAGE_CACHE_TIMEOUT
+#   matches.context_processors TEMPLATE_FRAGMENT_CACHE_TIMEOUT
+#   matches.search             SEARCH_RESULTS_LIMIT, SEARCH_HOT_CACHE_SIZE (0 = bez cache), SEARCH_HOT_CACHE_TTL
+#   matches.caching            CACHE_STALE_TTL, CACHE_COMPUTE_LOCK_TIMEOUT
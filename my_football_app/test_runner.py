@@ -0,0 +1,28 @@
+"""
+Runner testów (manage.py test): cache na fakeredis w pamięci procesu.
+
+Backend zostaje ten sam co w produkcji (RedisCache) – podmieniamy tylko
+klasę połączenia, więc testy nie potrzebują serwera Redis. Inne runnery
+(np. pytest) włączają to samo zmienną CACHE_FAKE_REDIS=1.
+"""
+import copy
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class FakeRedisTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        import fakeredis
+
+        super().setup_test_environment(**kwargs)
+        caches = copy.deepcopy(settings.CACHES)
+        caches['default'].setdefault('OPTIONS', {})['connection_class'] = fakeredis.FakeConnection
+        self._fake_redis = override_settings(CACHES=caches)
+        self._fake_redis.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._fake_redis.disable()
+        super().teardown_test_environment(**kwargs)